@@ -0,0 +1,132 @@
+"""
+Memory-mapped Arrow IPC copies of the listing files for sharing across worker processes.
+
+    python arrow_store.py              # materialize the listings and *_leverage_removed files
+
+Every listing parquet file is materialized once as an uncompressed, single-chunk Arrow IPC (Feather
+v2) file under `ARROW_DIR`, with the `schema` dictionaries applied (dictionary-encoded categoricals).
+Readers memory-map it. Numeric and timestamp columns without missing values become read-only pandas
+views of the page cache and string columns wrap the mapped Arrow buffers, so N workers reading the
+same file share one copy of them. The rest is copied per reader: bool columns are bit-packed in
+Arrow and unpacked by `to_pandas`, which also copies the int8 / int16 codes of the categoricals
+(`remove_unused_categories` in `read_model_frame` copies those once more). Both are 1-2 bytes per
+row, small next to the shared float64 columns.
+
+A materialized file is reused while the content digest of its parquet source (`file_digest`, as in
+the model store) and the category dictionaries are those recorded in its metadata, otherwise it is
+rewritten.
+
+Arrays derived from a listing file (design matrices, group codes) are shared the same way: the
+parent writes them once with `shared_arrays` and the workers open them with `map_arrays`.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from data_access import file_digest, read_listings
+from schema import categories
+from tracing import span
+
+# not from model_store: model_store reads its model frames through this module
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/"
+ARROW_DIR = ROOT_DIR + "data/intermediaries/arrow/"
+LISTINGS = [ROOT_DIR + "data/dfrent.parquet", ROOT_DIR + "data/dfbuy.parquet"]
+
+_SOURCE_KEY = b"source"
+
+
+def _source_key(path: str) -> str:
+    dictionaries = hashlib.sha256(json.dumps(categories(), sort_keys=True).encode()).hexdigest()
+    return json.dumps([os.path.abspath(path), file_digest(path), dictionaries[:16]])
+
+
+def arrow_path(parquet_path: str, arrow_dir: str = ARROW_DIR) -> str:
+    name = os.path.splitext(os.path.basename(parquet_path))[0]
+    return os.path.join(arrow_dir, f"{name}.arrow")
+
+
+def materialize(parquet_path: str, arrow_dir: str = ARROW_DIR, rebuild: bool = False) -> str:
+    """Writes (if stale) the Arrow IPC copy of `parquet_path` and returns its path."""
+    path = arrow_path(parquet_path, arrow_dir)
+    key = _source_key(parquet_path)
+    if os.path.exists(path) and not rebuild:
+        with pa.memory_map(path) as source:
+            metadata = ipc.open_file(source).schema.metadata or {}
+        if metadata.get(_SOURCE_KEY, b"").decode() == key:
+            return path
+
+    table = pa.Table.from_pandas(read_listings(parquet_path), preserve_index=False)
+    # one chunk per column, so that every column maps to a single contiguous buffer
+    table = table.combine_chunks()
+    table = table.replace_schema_metadata({**table.schema.metadata, _SOURCE_KEY: key.encode()})
+
+    os.makedirs(arrow_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_mapped(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Memory-maps the Arrow IPC file at `path` and returns `columns` (all by default) as a DataFrame.
+    Numeric columns without missing values are read-only views of the mapping, not copies; bool
+    columns and categorical codes are copied.
+    """
+    with span("arrow_map", file=os.path.basename(path)) as s:
+        with pa.memory_map(path) as source:
+            table = ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        # split_blocks: no consolidation of same-dtype columns into a (copied) 2D block
+        df = table.to_pandas(split_blocks=True)
+        s.rows = len(df)
+    return df
+
+
+def read_listings_mapped(
+    parquet_path: str, columns: list = None, arrow_dir: str = ARROW_DIR
+) -> pd.DataFrame:
+    """`read_listings` through the memory-mapped store (materialized on first use)."""
+    return read_mapped(materialize(parquet_path, arrow_dir), columns)
+
+
+@contextlib.contextmanager
+def shared_arrays(arrays: dict, arrow_dir: str = ARROW_DIR):
+    """
+    Writes `arrays` (key -> ndarray) to .npy files that live as long as the `with` block and yields
+    key -> path for `map_arrays` (e.g. as pool initializer arguments instead of the arrays).
+    """
+    os.makedirs(os.path.join(arrow_dir, "shared"), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.join(arrow_dir, "shared")) as directory:
+        paths = {}
+        for i, (key, array) in enumerate(arrays.items()):
+            paths[key] = os.path.join(directory, f"{i}.npy")
+            np.save(paths[key], np.ascontiguousarray(array))
+        yield paths
+
+
+def map_arrays(paths: dict) -> dict:
+    """Read-only memory maps of the arrays written by `shared_arrays`."""
+    return {key: np.load(path, mmap_mode="r") for key, path in paths.items()}
+
+
+def main():
+    from model_store import DATASETS
+
+    for parquet_path in LISTINGS + list(DATASETS.values()):
+        path = materialize(parquet_path)
+        print(f"{os.path.relpath(path, ROOT_DIR)}: {os.path.getsize(path) / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
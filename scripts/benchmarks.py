@@ -0,0 +1,507 @@
+"""
+Benchmarks of the data -> fit -> predict -> plot hot paths on synthetic listings.
+
+    python benchmarks.py run --rows 10000 100000 1000000 --zip-codes 193
+    python benchmarks.py run load cast ols --rows 100000
+    python benchmarks.py compare                 # latest run vs. the one before
+    python benchmarks.py compare --baseline 0 --threshold 0.2
+
+Synthetic listings have the columns and dtypes of dfrent.parquet / dfbuy.parquet and log prices
+drawn from the published model structure plus a random intercept per zip code. The first zip codes
+are the Berlin ones of `schema` (all 193 by default); beyond those (up to `--zip-codes`), made-up
+9xxxx codes are used. Those are outside the schema dictionary: the data benchmarks read them as
+missing zip codes, as scraped non-Berlin codes are. The fit and predict benchmarks encode the zip
+codes of their frame with the synthetic dictionary instead, so the number of random-intercept
+groups grows with `--zip-codes`; listings without a zip code are left out of the mixedlm fit as in
+`fit_model`.
+
+The data benchmarks time the code paths of the scripts: `load` is `read_listings`, `model_frame`
+is `read_model_frame` on its materialized Arrow copy (written next to the synthetic file).
+
+Every (benchmark, rows) case runs in a fresh process: setup (data loading, imports) is untimed,
+then the benchmark runs `--repeat` times. Peak memory is the high-water mark of the resident set
+during the timed runs above the resident set after setup (Linux; elsewhere the lifetime maximum of
+the process). The cli_* cases time whole `python cli.py` invocations (interpreter start included),
+i.e. the cold start of a shell pipeline call; their peak memory is not recorded. Results are
+appended to a JSON history that `compare` reads.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_access import MODEL_COLUMNS
+from model_store import FORMULA, ROOT_DIR
+from schema import OBJECT_TYPES, ROOMS, berlin_zip_codes
+
+HISTORY_PATH = ROOT_DIR + "data/intermediaries/benchmark_history.json"
+SIZES = [10_000, 100_000, 1_000_000]
+
+# setup(data_path, n_zip_codes) -> args of run; `rows`: whether the case scales with the listings
+Benchmark = namedtuple("Benchmark", ["setup", "run", "rows"])
+
+# log-scale effects of the synthetic price model (roughly those of the rentals model)
+_OBJECT_EFFECTS = {
+    "APARTMENT": 0.0,
+    "HOUSE": 0.3,
+    "SHARED_APARTMENT": -0.4,
+    "TEMPORARY_LIVING": 0.35,
+    "HOLIDAY_HOUSE_APARTMENT": 0.2,
+}
+_OBJECT_WEIGHTS = [0.7, 0.05, 0.1, 0.14, 0.01]
+_ROOM_WEIGHTS = [0.15, 0.35, 0.3, 0.1, 0.04, 0.02, 0.04]
+
+
+def zip_codes(n: int) -> list:
+    """The first `n` Berlin zip codes, padded with made-up 9xxxx codes beyond the 193 real ones."""
+    berlin = list(berlin_zip_codes())
+    return (berlin + [f"9{i:04d}" for i in range(max(n - len(berlin), 0))])[:n]
+
+
+def synthetic_listings(
+    n_rows: int, n_zip_codes: int = 193, to_rent: bool = True, seed: int = 0
+) -> pd.DataFrame:
+    """Synthetic listings with the columns of dfrent.parquet (`to_rent`) or dfbuy.parquet."""
+    rng = np.random.default_rng(seed)
+    zips = np.array(zip_codes(n_zip_codes))
+    zip_code = rng.choice(zips, n_rows, p=rng.dirichlet(np.full(len(zips), 2.0)))
+    zip_effect = dict(zip(zips, rng.normal(0, 0.15, len(zips))))
+
+    object_type = rng.choice(OBJECT_TYPES, n_rows, p=_OBJECT_WEIGHTS)
+    rooms = rng.choice(ROOMS, n_rows, p=_ROOM_WEIGHTS)
+    square_meters = np.round(rng.lognormal(np.log(70), 0.45, n_rows), 1)
+    private_offer = rng.random(n_rows) < 0.2
+
+    log_price = (
+        (np.log(12.0) if to_rent else np.log(4500.0))
+        + np.log(square_meters)
+        + pd.Series(object_type).map(_OBJECT_EFFECTS).to_numpy()
+        - 0.05 * private_offer
+        + pd.Series(zip_code).map(zip_effect).to_numpy()
+        + rng.normal(0, 0.25, n_rows)
+    )
+    price = np.round(np.exp(log_price), 0)
+    ids = rng.integers(100_000_000, 140_000_000, n_rows)
+
+    return pd.DataFrame(
+        {
+            "created_at": pd.Timestamp("2021-05-01")
+            + pd.to_timedelta(rng.integers(0, 14 * 86_400, n_rows), unit="s"),
+            "location": pd.Series(zip_code) + " Berlin",
+            "object_type": object_type,
+            "price": price,
+            "private_offer": private_offer,
+            "rooms": rooms,
+            "square_meters": square_meters,
+            "title": "Synthetic listing",
+            "to_rent": to_rent,
+            "url": [f"https://immoscout24.de/expose/{i}" for i in ids],
+            "zip_code": zip_code,
+            "ppsqm": price / square_meters,
+        }
+    )
+
+
+def write_synthetic(path: str, n_rows: int, n_zip_codes: int = 193, seed: int = 0) -> str:
+    """Writes synthetic rentals to `path` (plain string columns, as scraped) and returns it."""
+    table = pa.Table.from_pandas(
+        synthetic_listings(n_rows, n_zip_codes, seed=seed), preserve_index=False
+    )
+    pq.write_table(table, path)
+    return path
+
+
+def _model_frame(path: str) -> pd.DataFrame:
+    from model_store import read_model_frame
+
+    return read_model_frame(path, arrow_dir=os.path.dirname(path))
+
+
+def _fit_frame(path: str, n_zip_codes: int) -> pd.DataFrame:
+    """Model frame of `path` with its zip codes encoded by the synthetic dictionary of the run."""
+    df = _model_frame(path)
+    zip_code = pq.read_table(path, columns=["zip_code"]).column("zip_code").to_numpy()
+    df["zip_code"] = pd.Categorical(zip_code, categories=zip_codes(n_zip_codes))
+    return df
+
+
+def setup_load(path: str, n_zip_codes: int):
+    import data_access  # noqa: F401
+
+    return (path,)
+
+
+def run_load(path: str):
+    from data_access import read_listings
+
+    return read_listings(path, columns=MODEL_COLUMNS)
+
+
+def setup_model_frame(path: str, n_zip_codes: int):
+    # materialized once here, as by the first reader of a listing file
+    _model_frame(path)
+    return (path,)
+
+
+def setup_map(path: str, n_zip_codes: int):
+    from arrow_store import materialize
+
+    return (materialize(path, arrow_dir=os.path.dirname(path)),)
+
+
+def run_map(arrow_path: str):
+    from arrow_store import read_mapped
+
+    return read_mapped(arrow_path, columns=MODEL_COLUMNS)
+
+
+def setup_cast(path: str, n_zip_codes: int):
+    return (pq.read_table(path, columns=MODEL_COLUMNS).to_pandas(),)
+
+
+def run_cast(df: pd.DataFrame):
+    from schema import apply_schema
+
+    return apply_schema(df.copy())
+
+
+def setup_fit(path: str, n_zip_codes: int):
+    import statsmodels.formula.api  # noqa: F401
+
+    return (_fit_frame(path, n_zip_codes),)
+
+
+def run_ols(df: pd.DataFrame):
+    import statsmodels.formula.api as smf
+
+    return smf.ols(FORMULA, data=df).fit()
+
+
+def run_mixedlm(df: pd.DataFrame):
+    from model_store import fit_model
+
+    return fit_model(FORMULA, df, "mixedlm")
+
+
+def run_reml(df: pd.DataFrame):
+    from random_intercept import fit_random_intercept
+
+    return fit_random_intercept(FORMULA, df)
+
+
+def setup_predict(path: str, n_zip_codes: int):
+    from model_store import StoredModel
+
+    df = _fit_frame(path, n_zip_codes)
+    # an OLS fit with made-up intercepts stands in for the mixed model: prediction only needs the
+    # fixed effects and one intercept per zip code
+    model = StoredModel.from_result(run_ols(df), FORMULA, "ols", df)
+    model.kind = "mixedlm"
+    model.ranef = pd.Series(
+        np.random.default_rng(0).normal(0, 0.15, n_zip_codes),
+        index=pd.Index(zip_codes(n_zip_codes), dtype="str"),
+    )
+    return model, df
+
+
+def run_predict(model, df: pd.DataFrame):
+    from ranef_predict import predict_with_ranef
+
+    return predict_with_ranef(model, df)
+
+
+def setup_locate(path: str, n_zip_codes: int):
+    from zip_locator import load_locator
+
+    # listing coordinates: uniform over the bounding box of the zip areas, one point per row
+    locator = load_locator()
+    x0, y0, x1, y1 = locator.bounds
+    n_rows = pq.read_metadata(path).num_rows
+    rng = np.random.default_rng(0)
+    return locator, rng.uniform(x0, x1, n_rows), rng.uniform(y0, y1, n_rows)
+
+
+def run_locate(locator, lon: np.ndarray, lat: np.ndarray):
+    return locator.locate(lon, lat)
+
+
+def setup_dist_to_mitte(path: str, n_zip_codes: int):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from zip_geometry import load_zip_geometry
+
+    # one row per zip area as in merge_significance, Berlin zip codes repeated up to n_zip_codes
+    rng = np.random.default_rng(0)
+    merged = pd.DataFrame(
+        {
+            "zip": np.resize(berlin_zip_codes(), n_zip_codes),
+            "pointestimate_sig": np.where(
+                rng.random(n_zip_codes) < 0.6, rng.normal(0, 0.15, n_zip_codes), 0.0
+            ),
+        }
+    )
+    fig, ax = plt.subplots()
+    return merged, ax, load_zip_geometry()
+
+
+def run_dist_to_mitte(merged: pd.DataFrame, ax, zip_geometry: pd.DataFrame):
+    from figures import create_dist_to_mitte_plot
+
+    ax.clear()
+    create_dist_to_mitte_plot(merged, ax, "Rentals", zip_geometry)
+
+
+def setup_cli(path: str, n_zip_codes: int):
+    # the first call memoizes the scorer; the benchmark measures the warm-cache cold start
+    command = [
+        sys.executable,
+        os.path.join(ROOT_DIR, "scripts", "cli.py"),
+        "predict",
+        "rentals",
+        "--object-type=APARTMENT",
+        "--rooms=3",
+        "--square-meters=65",
+        "--zip-code=13059",
+    ]
+    run_cli(command)
+    return (command,)
+
+
+def setup_cli_help(path: str, n_zip_codes: int):
+    return ([sys.executable, os.path.join(ROOT_DIR, "scripts", "cli.py"), "--help"],)
+
+
+def run_cli(command: list):
+    subprocess.run(command, check=True, capture_output=True)
+
+
+BENCHMARKS = {
+    "load": Benchmark(setup_load, run_load, True),
+    "map": Benchmark(setup_map, run_map, True),
+    "model_frame": Benchmark(setup_model_frame, _model_frame, True),
+    "cast": Benchmark(setup_cast, run_cast, True),
+    "ols": Benchmark(setup_fit, run_ols, True),
+    "mixedlm": Benchmark(setup_fit, run_mixedlm, True),
+    "reml": Benchmark(setup_fit, run_reml, True),
+    "predict": Benchmark(setup_predict, run_predict, True),
+    "locate": Benchmark(setup_locate, run_locate, True),
+    "dist_to_mitte": Benchmark(setup_dist_to_mitte, run_dist_to_mitte, False),
+    "cli_startup": Benchmark(setup_cli_help, run_cli, False),
+    "cli_predict": Benchmark(setup_cli, run_cli, False),
+}
+
+
+def _rss_kb(field: str):
+    """Current ("VmRSS") or peak ("VmHWM") resident set of this process in kB, None off Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def run_case(name: str, data_path: str, n_rows: int, n_zip_codes: int, repeat: int) -> dict:
+    """Sets up and times one benchmark case. Runs inside a fresh worker process."""
+    benchmark = BENCHMARKS[name]
+    args = benchmark.setup(data_path, n_zip_codes)
+
+    baseline_kb = _rss_kb("VmRSS")
+    exact_peak = _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark.run(*args)
+        times.append(time.perf_counter() - start)
+
+    if exact_peak and baseline_kb is not None:
+        peak_kb = _rss_kb("VmHWM") - baseline_kb
+    else:
+        # lifetime maximum (kB on Linux, bytes on macOS), setup included
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_kb = peak_kb // 1024 if sys.platform == "darwin" else peak_kb
+    return {
+        "benchmark": name,
+        "rows": n_rows,
+        "zip_codes": n_zip_codes,
+        "repeat": repeat,
+        "min_seconds": min(times),
+        "median_seconds": float(np.median(times)),
+        # the memory of cli_* subprocesses is not visible from here
+        "peak_mb": None if benchmark.run is run_cli else peak_kb / 1024,
+    }
+
+
+def run_benchmarks(
+    names=None, sizes=SIZES, n_zip_codes: int = 193, repeat: int = 3, seed: int = 0
+) -> list:
+    """
+    Runs every case of `names` (all by default) one after another, each in its own process, and
+    returns one result dict per case. Cases that do not scale with the listings run once.
+    """
+    names = list(BENCHMARKS) if names is None else list(names)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in sizes:
+            path = write_synthetic(
+                os.path.join(tmp_dir, f"listings_{n_rows}.parquet"), n_rows, n_zip_codes, seed
+            )
+            for name in names:
+                if not BENCHMARKS[name].rows and n_rows != sizes[0]:
+                    continue
+                # one process per case, so that peak memory and imports are not shared
+                with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                    result = pool.submit(run_case, name, path, n_rows, n_zip_codes, repeat).result()
+                if not BENCHMARKS[name].rows:
+                    result["rows"] = None
+                peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+                print(
+                    f"{name:>14} {n_rows if BENCHMARKS[name].rows else '':>9} "
+                    f"{result['min_seconds']:9.4f}s {peak:>9} MB",
+                    flush=True,
+                )
+                results.append(result)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path: str = HISTORY_PATH) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(results: list, path: str = HISTORY_PATH) -> dict:
+    """Appends a run (results plus commit and machine) to the history file and returns it."""
+    run = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    history = read_history(path) + [run]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+    return run
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> pd.DataFrame:
+    """
+    Cases present in both runs with their min times and peak memory, the current / baseline ratios
+    and `regression` where a ratio exceeds 1 + `threshold`.
+    """
+    keys = ["benchmark", "rows", "zip_codes"]
+    columns = keys + ["min_seconds", "peak_mb"]
+    baseline, current = (
+        pd.DataFrame(run["results"])[columns].astype({"rows": "Int64"})
+        for run in (baseline, current)
+    )
+    merged = pd.merge(
+        baseline,
+        current,
+        on=keys,
+        suffixes=("_baseline", "_current"),
+    )
+    merged["time_ratio"] = merged["min_seconds_current"] / merged["min_seconds_baseline"]
+    merged["memory_ratio"] = merged["peak_mb_current"] / merged["peak_mb_baseline"].clip(lower=1)
+    merged["regression"] = (merged["time_ratio"] > 1 + threshold) | (
+        merged["memory_ratio"] > 1 + threshold
+    )
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmarks and append them to the history")
+    run_parser.add_argument("benchmarks", nargs="*", help=f"any of {', '.join(BENCHMARKS)}")
+    run_parser.add_argument("--rows", type=int, nargs="+", default=SIZES)
+    run_parser.add_argument("--zip-codes", type=int, default=193)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--history", default=HISTORY_PATH)
+
+    compare_parser = commands.add_parser("compare", help="compare two runs of the history")
+    compare_parser.add_argument(
+        "--baseline", type=int, default=-2, help="history index of the baseline run (default: -2)"
+    )
+    compare_parser.add_argument("--current", type=int, default=-1)
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--history", default=HISTORY_PATH)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        unknown = sorted(set(args.benchmarks) - set(BENCHMARKS))
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+        results = run_benchmarks(
+            args.benchmarks or None, sorted(args.rows), args.zip_codes, args.repeat, args.seed
+        )
+        run = append_history(results, args.history)
+        print(f"appended run {run['timestamp']} ({run['commit']}) to {args.history}")
+        return
+
+    history = read_history(args.history)
+    try:
+        baseline, current = history[args.baseline], history[args.current]
+    except IndexError:
+        parser.error(f"{args.history} has {len(history)} runs")
+    table = compare(baseline, current, args.threshold)
+    if table.empty:
+        parser.error("the two runs have no benchmark case in common")
+    print(f"baseline: {baseline['timestamp']} ({baseline['commit']})")
+    print(f"current:  {current['timestamp']} ({current['commit']})")
+    print(table.round(4).to_string(index=False))
+    sys.exit(int(table["regression"].any()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Command-line entry point of the analysis.
+
+    python cli.py fit [--refit] [--workers 4]
+    python cli.py predict rentals --object-type APARTMENT --rooms 3 --square-meters 65 \\
+        --zip-code 13059
+    python cli.py predict sales --input listings.jsonl         # one JSON listing per line, or "-"
+    python cli.py plots [compare_coefs.png ...] [--force] [--list]
+    python cli.py geo --point 13.38 52.52                      # or "lon lat" lines via --input
+
+Only the standard library is imported at startup; every subcommand imports what it needs when it
+runs. Results are memoized on disk: fitted models in the model store, rendered figures in the
+render manifest, zip geometry and raster in data/intermediaries, and the compiled price scorer of
+each model in `SCORER_DIR`. `predict` only needs NumPy while its scorer is current: the scorer is
+revalidated by size and modification time of the model data and of the modules that built it, and
+rebuilt from the model store otherwise.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/"
+SCRIPTS_DIR = ROOT_DIR + "scripts/"
+SCORER_DIR = ROOT_DIR + "data/intermediaries/models/scorers/"
+
+# modules whose changes (formula, artifact layout, encoding) invalidate a memoized scorer
+SCORER_CODE = ("model_store.py", "scoring.py", "schema.py")
+FIELDS = ["object_type", "private_offer", "rooms", "square_meters", "zip_code"]
+
+
+def _stat(path: str) -> list:
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime_ns]
+
+
+def _sources_current(sources: list) -> bool:
+    try:
+        return all(_stat(path) == [path, size, mtime] for path, size, mtime in sources)
+    except OSError:
+        return False
+
+
+def load_scorer(dataset: str, kind: str = "mixedlm", refit: bool = False):
+    """
+    ListingScorer of the (`dataset`, interaction formula, `kind`) model. Served from its memoized
+    .npz while the sources it was built from are unchanged, otherwise built from the model store.
+    """
+    import numpy as np
+
+    from scoring import ListingScorer
+
+    path = os.path.join(SCORER_DIR, f"{dataset}_{kind}.npz")
+    if os.path.exists(path) and not refit:
+        with np.load(path) as npz:
+            current = _sources_current(json.loads(str(npz["sources"])))
+        if current:
+            return ListingScorer.load(path)
+
+    from model_store import DATASETS, FORMULA, load_or_fit
+
+    scorer = ListingScorer.from_model(load_or_fit(FORMULA, DATASETS[dataset], kind, refit=refit))
+    sources = [_stat(DATASETS[dataset])] + [_stat(SCRIPTS_DIR + module) for module in SCORER_CODE]
+    os.makedirs(SCORER_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    scorer.save(tmp_path, sources=json.dumps(sources))
+    os.replace(tmp_path, path)
+    return scorer
+
+
+def _read_lines(path: str) -> list:
+    f = sys.stdin if path == "-" else open(path)
+    with f:
+        return [line for line in f.read().splitlines() if line.strip()]
+
+
+def cmd_fit(args):
+    import time
+
+    from fit_grid import fit_grid
+
+    start = time.perf_counter()
+    table, _ = fit_grid(kinds=args.kinds, max_workers=args.workers, refit=args.refit)
+    print(table.to_string(index=False))
+    print(f"total wall time: {time.perf_counter() - start:.2f}s")
+
+
+def cmd_predict(args):
+    if args.input:
+        lines = _read_lines(args.input)
+        # a JSON array, or one JSON listing per line
+        listings = (
+            json.loads(lines[0])
+            if len(lines) == 1 and lines[0].lstrip()[0] == "["
+            else [json.loads(line) for line in lines]
+        )
+        for i, listing in enumerate(listings, 1):
+            if not isinstance(listing, dict):
+                raise SystemExit(f"listing {i}: expected a JSON object, got {listing!r}")
+            missing = [field for field in FIELDS if field not in listing]
+            if missing:
+                raise SystemExit(f"listing {i}: missing fields: {', '.join(missing)}")
+    else:
+        listing = {field: getattr(args, field) for field in FIELDS}
+        missing = [field for field, value in listing.items() if value is None]
+        if missing:
+            raise SystemExit(f"missing listing fields: {', '.join(missing)} (or use --input)")
+        listings = [listing]
+
+    scorer = load_scorer(args.dataset, args.kind, args.refit)
+    try:
+        prices = scorer.score_batch({col: [listing[col] for listing in listings] for col in FIELDS})
+    except ValueError as error:
+        # e.g. a level the model was not fit on
+        raise SystemExit(str(error))
+    print("\n".join(f"{price:.2f}" for price in prices))
+
+
+def cmd_plots(args):
+    import render_figures
+
+    render_figures.main(args.options)
+
+
+def cmd_geo(args):
+    import numpy as np
+
+    from zip_locator import load_locator
+
+    points = [tuple(point) for point in args.point or []]
+    if args.input:
+        points += [
+            tuple(map(float, line.replace(",", " ").split())) for line in _read_lines(args.input)
+        ]
+    lon, lat = np.array(points, dtype="float64").reshape(-1, 2).T
+    # an empty line for points outside all zip areas
+    print("\n".join(zip_code or "" for zip_code in load_locator().zip_codes_of(lon, lat)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Berlin real estate price analysis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser("fit", help="fit (or load) the model grid")
+    fit.add_argument("--kinds", nargs="+", default=["ols", "mixedlm"])
+    fit.add_argument("--workers", type=int, default=None)
+    fit.add_argument("--refit", action="store_true", help="ignore stored artifacts")
+    fit.set_defaults(run=cmd_fit)
+
+    predict = commands.add_parser("predict", help="predict listing prices (EUR)")
+    predict.add_argument("dataset", choices=["rentals", "sales"])
+    predict.add_argument("--kind", default="mixedlm", choices=["ols", "mixedlm", "reml"])
+    predict.add_argument("--input", help="JSON listings file, - for stdin")
+    predict.add_argument("--object-type", dest="object_type")
+    predict.add_argument(
+        "--private-offer", dest="private_offer", action="store_true", default=False
+    )
+    predict.add_argument("--rooms")
+    predict.add_argument("--square-meters", dest="square_meters", type=float)
+    predict.add_argument("--zip-code", dest="zip_code")
+    predict.add_argument("--refit", action="store_true", help="rebuild the scorer (and model)")
+    predict.set_defaults(run=cmd_predict)
+
+    plots = commands.add_parser(
+        "plots", help="render the stale report figures (options of render_figures.py)"
+    )
+    plots.set_defaults(run=cmd_plots)
+
+    geo = commands.add_parser("geo", help="zip codes of lon / lat points")
+    geo.add_argument("--point", nargs=2, type=float, action="append", metavar=("LON", "LAT"))
+    geo.add_argument("--input", help='file of "lon lat" lines, - for stdin')
+    geo.set_defaults(run=cmd_geo)
+
+    # everything after `plots` is passed on to render_figures.py
+    args, options = parser.parse_known_args(argv)
+    if options and args.command != "plots":
+        parser.error(f"unrecognized arguments: {' '.join(options)}")
+    args.options = options
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
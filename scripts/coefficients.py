@@ -0,0 +1,200 @@
+"""
+Typed coefficient export of the fitted models.
+
+    python coefficients.py [--refit]
+
+Fixed effects (estimate, std. error, t value, p value) of every published model are written to one
+long parquet table with R-style term names ("object_typeHOUSE", "rooms2:square_meters"), the names
+of the analysis_script_*.R output. LaTeX tables are rendered from that file to `*_summary_py.tex`,
+next to (never over) the `*_summary.tex` tables written by the R scripts, and consumers (e.g. the
+coefficient comparison plot) read it with a filter on `model`.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.special import ndtr
+
+from model_store import DATASETS, ROOT_DIR, read_model_frame
+from scoring import parse_term
+
+OUTPUT_DIR = ROOT_DIR + "documents/scripts_output/"
+COEF_PATH = OUTPUT_DIR + "coefficients.parquet"
+
+SCHEMA = pa.schema(
+    [
+        ("model", pa.string()),
+        ("term", pa.string()),
+        ("estimate", pa.float64()),
+        ("std_error", pa.float64()),
+        ("t_value", pa.float64()),
+        ("p_value", pa.float64()),
+    ]
+)
+
+# published table -> (dataset, fit_grid formula name, kind, standardized response), following
+# analysis_script_*.R: the rentals hierarchical model is fit on scale(log(price))
+TABLES = {
+    "rentals_model0": ("rentals", "additive", "ols", False),
+    "rentals_model1": ("rentals", "interaction", "ols", False),
+    "rentals_model2": ("rentals", "interaction", "mixedlm", True),
+    "sales_model0": ("sales", "additive", "ols", False),
+    "sales_model1": ("sales", "interaction", "ols", False),
+    "sales_model2": ("sales", "interaction", "mixedlm", False),
+}
+
+
+def r_term_name(name: str) -> str:
+    """R name of a patsy column, e.g. "rooms[T.2]:square_meters" -> "rooms2:square_meters"."""
+    factors = parse_term(name)
+    if not factors:
+        return "(Intercept)"
+    return ":".join(
+        col if level is None else col + {"True": "TRUE", "False": "FALSE"}.get(level, level)
+        for col, level in factors
+    )
+
+
+def coef_table(model, name: str, response_scale: tuple = None) -> pd.DataFrame:
+    """
+    Fixed-effects table of a StoredModel in the export schema. With `response_scale` = (mean, sd)
+    of the response, coefficients are reported for the standardized response (as R's
+    `scale(log(price))`): slopes and std. errors are divided by sd, the intercept is centered first,
+    and t / p values are recomputed.
+    """
+    fe = model.fe_params
+    estimate = fe.to_numpy(dtype="float64")
+    std_error = model.bse[fe.index].to_numpy(dtype="float64")
+    t_value = model.tvalues[fe.index].to_numpy(dtype="float64")
+    p_value = model.pvalues[fe.index].to_numpy(dtype="float64")
+
+    if response_scale is not None:
+        mean, sd = response_scale
+        estimate = np.where(fe.index == "Intercept", estimate - mean, estimate) / sd
+        std_error = std_error / sd
+        t_value = estimate / std_error
+        p_value = 2 * ndtr(-np.abs(t_value))
+
+    return pd.DataFrame(
+        {
+            "model": name,
+            "term": [r_term_name(term) for term in fe.index],
+            "estimate": estimate,
+            "std_error": std_error,
+            "t_value": t_value,
+            "p_value": p_value,
+        }
+    )
+
+
+def read_coefficients(models: list = None, path: str = COEF_PATH) -> pd.DataFrame:
+    """Coefficient rows of `models` (all by default); the model filter is pushed down to parquet."""
+    filters = [("model", "in", list(models))] if models is not None else None
+    return pq.read_table(path, filters=filters).to_pandas()
+
+
+def write_coefficients(tables: list, path: str = COEF_PATH) -> pd.DataFrame:
+    """
+    Writes the coefficient tables to `path`, replacing the rows of the same models and keeping
+    those of other models already in the file.
+    """
+    new = pd.concat(tables, ignore_index=True)
+    if os.path.exists(path):
+        kept = read_coefficients(path=path).query("~model.isin(@new.model)")
+        new = pd.concat([kept, new], ignore_index=True)
+
+    table = pa.Table.from_pandas(new, schema=SCHEMA, preserve_index=False)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return new
+
+
+def to_latex(coefs: pd.DataFrame, digits: int = 2, p_values: bool = False) -> str:
+    """
+    Renders one model's coefficients in the layout of R's `print(xtable(...))`: `digits` decimals
+    for estimate and std. error, 2 for t values and an optional 4-decimal p value column.
+    """
+    header = ["", "Estimate", "Std. Error", "t value"] + (["Pr($>$$|$t$|$)"] if p_values else [])
+    rows = []
+    for row in coefs.itertuples():
+        cells = [
+            row.term.replace("_", "\\_"),
+            f"{row.estimate:.{digits}f}",
+            f"{row.std_error:.{digits}f}",
+            f"{row.t_value:.2f}",
+        ] + ([f"{row.p_value:.4f}"] if p_values else [])
+        rows.append(" & ".join(cells) + " \\\\ ")
+
+    lines = [
+        "\\begin{table}[ht]",
+        "\\centering",
+        f"\\begin{{tabular}}{{{'r' * len(header)}}}",
+        "  \\hline",
+        " & ".join(header) + " \\\\ ",
+        "  \\hline",
+        "\n  ".join(rows),
+        "   \\hline",
+        "\\end{tabular}",
+        "\\end{table}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def render_latex(name: str, path: str = COEF_PATH, output_dir: str = OUTPUT_DIR) -> str:
+    """Writes `<output_dir>/<name>_summary_py.tex` from the coefficient file and returns its path."""
+    kind = TABLES[name][2]
+    tex = to_latex(
+        read_coefficients([name], path), digits=4 if kind == "ols" else 2, p_values=kind == "ols"
+    )
+    tex_path = os.path.join(output_dir, f"{name}_summary_py.tex")
+    with open(tex_path, "w") as f:
+        f.write(tex)
+    return tex_path
+
+
+def export_coefficients(
+    models: dict, path: str = COEF_PATH, output_dir: str = OUTPUT_DIR, latex: bool = True
+) -> pd.DataFrame:
+    """
+    Exports the published tables available in `models` (as returned by `fit_grid`: keyed by
+    (dataset, formula name, kind)) to the coefficient file and renders their LaTeX tables.
+    """
+    tables = []
+    for name, (dataset, formula_name, kind, standardized) in TABLES.items():
+        model = models.get((dataset, formula_name, kind))
+        if model is None:
+            continue
+        response_scale = None
+        if standardized:
+            log_price = np.log(read_model_frame(DATASETS[dataset])["price"])
+            response_scale = (log_price.mean(), log_price.std())
+        tables.append(coef_table(model, name, response_scale))
+
+    coefs = write_coefficients(tables, path)
+    if latex:
+        for table in tables:
+            render_latex(table["model"].iloc[0], path, output_dir)
+    return coefs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the model coefficients")
+    parser.add_argument("--refit", action="store_true", help="ignore stored model artifacts")
+    parser.add_argument("--no-latex", action="store_true", help="only write the parquet file")
+    args = parser.parse_args()
+
+    from fit_grid import fit_grid
+
+    _, models = fit_grid(refit=args.refit)
+    coefs = export_coefficients(models, latex=not args.no_latex)
+    print(coefs.groupby("model", sort=False).size().to_string())
+
+
+if __name__ == "__main__":
+    main()
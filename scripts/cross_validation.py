@@ -0,0 +1,212 @@
+"""
+Out-of-sample evaluation of the OLS and random-intercept models with parallel folds.
+
+    python cross_validation.py --folds 5 --workers 4
+
+Every (dataset, formula) design matrix is built with patsy once and written to a shared file that
+the workers memory-map (pool initializer), so all of them read the same copy; folds only carry
+their test row indices. Schemes:
+    kfold  shuffled K-fold over listings; zip codes of the test listings are usually seen in training
+    group  K-fold over zip codes; test zip codes are unseen, so the mixed model predicts with a zero
+           intercept there
+
+Listings without a zip code (group code -1) count as one more group in the group folds; they are
+left out of the random-intercept fits and predicted with a zero intercept.
+
+Metrics per fold: R^2 and RMSE on log price, MAPE (%) on the euro price exp(prediction).
+"""
+
+import argparse
+import itertools
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from arrow_store import map_arrays, shared_arrays
+from fit_grid import FORMULAS, KINDS
+from model_store import DATASETS, read_model_frame
+from tracing import TRACER, init_worker
+
+SCHEMES = ["kfold", "group"]
+
+# (dataset, formula name) -> (X, y, group codes), memory-mapped once per worker by `_init_worker`
+_DESIGNS = {}
+
+
+def design(formula: str, df: pd.DataFrame, groups: str = "zip_code"):
+    """Fixed-effects design matrix, response and integer group codes of `formula` on `df`."""
+    import patsy
+
+    y, X = patsy.dmatrices(
+        formula, df, return_type="dataframe", eval_env=patsy.EvalEnvironment([{"np": np}])
+    )
+    codes = df.loc[X.index, groups].cat.codes.to_numpy()
+    return X.to_numpy(dtype="float64"), y.iloc[:, 0].to_numpy(dtype="float64"), codes
+
+
+def folds(scheme: str, codes: np.ndarray, k: int = 5, seed: int = 0) -> list:
+    """Test row indices of the `k` folds of `scheme` ("kfold" or "group")."""
+    rng = np.random.default_rng(seed)
+    if scheme == "kfold":
+        return np.array_split(rng.permutation(len(codes)), k)
+    if scheme == "group":
+        # listings without a zip code (-1) form one extra group
+        n_groups = codes.max() + 1
+        assignment = rng.permutation(n_groups + 1) % k
+        groups = np.where(codes < 0, n_groups, codes)
+        return [np.flatnonzero(assignment[groups] == fold) for fold in range(k)]
+    raise ValueError(f"Unknown scheme: {scheme}")
+
+
+def metrics(y: np.ndarray, pred: np.ndarray) -> dict:
+    """R^2 and RMSE of log-price predictions, MAPE (%) of the implied euro prices."""
+    resid = y - pred
+    return {
+        "r2": 1 - (resid**2).sum() / ((y - y.mean()) ** 2).sum(),
+        "rmse": np.sqrt((resid**2).mean()),
+        "mape": 100 * np.abs(np.expm1(-resid)).mean(),
+    }
+
+
+def _intercepts(ranef: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Random intercepts of the rows with group `codes`; zero for rows without a group (-1)."""
+    return np.where(codes >= 0, ranef[np.maximum(codes, 0)], 0.0)
+
+
+def fit_predict(kind: str, X: np.ndarray, y: np.ndarray, codes: np.ndarray, train, test):
+    """Fits `kind` on the train rows and predicts the test rows (zero intercept for unseen groups)."""
+    if kind != "ols":
+        # the random-intercept fits only see listings with a zip code
+        train = train & (codes >= 0)
+    # dummy columns without any training listing (rare levels in a fold) are left out
+    keep = X[train].any(axis=0)
+    X_train, X_test = X[train][:, keep], X[test][:, keep]
+
+    if kind == "ols":
+        beta, *_ = np.linalg.lstsq(X_train, y[train], rcond=None)
+        return X_test @ beta
+
+    if kind == "mixedlm":
+        import statsmodels.api as sm
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = sm.MixedLM(y[train], X_train, groups=codes[train]).fit()
+        beta = np.asarray(result.fe_params)
+        cov_re = float(np.asarray(result.cov_re)[0, 0])
+        n_groups = codes.max() + 1
+        resid = y[train] - X_train @ beta
+        sums = np.bincount(codes[train], weights=resid, minlength=n_groups)
+        counts = np.bincount(codes[train], minlength=n_groups)
+        ranef = cov_re * sums / (result.scale + counts * cov_re)
+        return X_test @ beta + _intercepts(ranef, codes[test])
+
+    if kind == "reml":
+        from random_intercept import fit_arrays
+
+        fit = fit_arrays(X_train, y[train], codes[train])
+        ranef = np.zeros(codes.max() + 1)
+        ranef[: len(fit["ranef"])] = fit["ranef"]
+        return X_test @ fit["beta"] + _intercepts(ranef, codes[test])
+
+    raise ValueError(f"Unknown model kind: {kind}")
+
+
+def _init_worker(paths: dict, trace: dict = None):
+    init_worker(trace)
+    arrays = map_arrays(paths)
+    for dataset, name, part in paths:
+        _DESIGNS.setdefault((dataset, name), [None] * 3)[part] = arrays[dataset, name, part]
+
+
+def run_fold(dataset: str, formula_name: str, kind: str, scheme: str, fold: int, test) -> dict:
+    """Evaluates one fold. Runs inside a worker process."""
+    X, y, codes = _DESIGNS[dataset, formula_name]
+    train = np.ones(len(y), dtype=bool)
+    train[test] = False
+
+    start = time.perf_counter()
+    pred = fit_predict(kind, X, y, codes, train, test)
+    return {
+        "dataset": dataset,
+        "formula": formula_name,
+        "kind": kind,
+        "scheme": scheme,
+        "fold": fold,
+        "n_train": int(train.sum()),
+        "n_test": len(test),
+        **metrics(y[test], pred),
+        "fit_seconds": time.perf_counter() - start,
+    }
+
+
+def cross_validate(
+    datasets=tuple(DATASETS),
+    formulas: dict = FORMULAS,
+    kinds=KINDS,
+    schemes=SCHEMES,
+    k: int = 5,
+    seed: int = 0,
+    max_workers: int = None,
+) -> pd.DataFrame:
+    """
+    Evaluates every (dataset, formula, kind, scheme) combination with `k` folds in parallel and
+    returns one row of metrics per fold. All kinds and formulas of a dataset share the same folds.
+    """
+    designs = {}
+    tasks = []
+    for dataset in datasets:
+        df = read_model_frame(DATASETS[dataset])
+        for name, formula in formulas.items():
+            designs[dataset, name] = design(formula, df)
+        codes = designs[dataset, next(iter(formulas))][2]
+        for scheme in schemes:
+            for fold, test in enumerate(folds(scheme, codes, k, seed)):
+                tasks += [
+                    (dataset, name, kind, scheme, fold, test)
+                    for name, kind in itertools.product(formulas, kinds)
+                ]
+
+    arrays = {
+        (dataset, name, part): array
+        for (dataset, name), parts in designs.items()
+        for part, array in enumerate(parts)
+    }
+    with shared_arrays(arrays) as paths, ProcessPoolExecutor(
+        max_workers=max_workers or min(len(tasks), os.cpu_count()),
+        initializer=_init_worker,
+        initargs=(paths, TRACER.worker_config()),
+    ) as pool:
+        futures = [pool.submit(run_fold, *task) for task in tasks]
+        return pd.DataFrame([future.result() for future in futures])
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Mean and std. deviation of the fold metrics per model and scheme."""
+    return results.groupby(["dataset", "formula", "kind", "scheme"])[["r2", "rmse", "mape"]].agg(
+        ["mean", "std"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate the model grid")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--per-fold", action="store_true", help="print every fold")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = cross_validate(k=args.folds, seed=args.seed, max_workers=args.workers)
+    if args.per_fold:
+        print(results.to_string(index=False))
+    print(summarize(results).round(4).to_string())
+    print(f"total wall time: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
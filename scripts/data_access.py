@@ -0,0 +1,109 @@
+"""
+Column-projected, filter-pushdown access to the listing parquet files.
+
+Only the requested columns are decoded, and row filters are evaluated against the row-group
+statistics first, so row groups that cannot match are never read.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from schema import apply_schema
+from tracing import span
+
+MODEL_COLUMNS = ["price", "object_type", "private_offer", "rooms", "square_meters", "zip_code"]
+
+_CACHE_KEY = b"cache_key"
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_listings(path: str, columns: list = None, filters=None) -> pd.DataFrame:
+    """
+    Reads `columns` of the parquet file at `path`. `filters` uses the pyarrow DNF format,
+    e.g. [("square_meters", "<=", 328.08)], and is pushed down to the row groups.
+    Categorical listing columns are encoded with the fixed dictionaries of `schema`.
+    """
+    with span("parquet_load", file=os.path.basename(path)) as s:
+        df = pq.read_table(path, columns=columns, filters=filters).to_pandas()
+        s.rows = len(df)
+    with span("category_cast", rows=len(df)):
+        return apply_schema(df)
+
+
+def iter_batches(path: str, columns: list = None, filters=None, batch_size: int = 1 << 16):
+    """
+    Streams the parquet file at `path` as DataFrames of at most `batch_size` rows, row group by
+    row group, so aggregations only ever hold one batch in memory.
+    """
+    dataset = ds.dataset(path, format="parquet")
+    filter_expr = pq.filters_to_expression(filters) if filters else None
+    for batch in dataset.to_batches(columns=columns, filter=filter_expr, batch_size=batch_size):
+        if batch.num_rows:
+            yield apply_schema(batch.to_pandas())
+
+
+def column_quantile(
+    path: str, column: str, q: float, fill_value: float = 0.0, approximate: bool = False
+) -> float:
+    """
+    Quantile `q` of a single column (missing values counted as `fill_value`, like
+    `np.quantile(df[column].fillna(0), q)`). Only that one column is read.
+    With `approximate`, the column is streamed through a t-digest instead of being loaded whole.
+    """
+    if approximate:
+        # imported here as quantile_sketch streams through this module
+        from quantile_sketch import sketch_column
+
+        return float(sketch_column(path, column, fill_value).quantile(q))
+    values = pq.read_table(path, columns=[column]).column(column)
+    return float(np.quantile(values.fill_null(fill_value).to_numpy(), q))
+
+
+def read_below_quantile(
+    path: str,
+    column: str,
+    q: float,
+    columns: list = None,
+    fill_value: float = 0.0,
+    approximate: bool = False,
+) -> pd.DataFrame:
+    """
+    Reads the rows with `column <= quantile(column, q)` (missing values never pass, as with
+    `df.query("column <= @cutoff")`), e.g. the 99.9th percentile square_meters outlier cut.
+    """
+    cutoff = column_quantile(path, column, q, fill_value, approximate)
+    return read_listings(path, columns=columns, filters=[(column, "<=", cutoff)])
+
+
+def cached_parquet(cache_path: str, key: str, build, rebuild: bool = False) -> pd.DataFrame:
+    """
+    Returns the DataFrame cached at `cache_path` if it was written for the same `key` (stored in the
+    parquet metadata, e.g. a digest of the inputs), otherwise calls `build()` and caches its result.
+    """
+    if os.path.exists(cache_path) and not rebuild:
+        metadata = pq.read_schema(cache_path).metadata or {}
+        if metadata.get(_CACHE_KEY, b"").decode() == key:
+            return pd.read_parquet(cache_path)
+
+    df = build()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, _CACHE_KEY: key.encode()})
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    # write to a temporary file first so that concurrent readers never see a partial cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return df
@@ -0,0 +1,600 @@
+"""
+Figure builders shared by the plotting scripts and the batch renderer (render_figures.py).
+
+Every function takes its data as arguments and returns the matplotlib figure without saving or
+showing it, so the same code draws inline in the notebook cells and headless in render workers.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from model_store import ROOT_DIR
+from tracing import span
+
+DUKEBLUE = "#00339B"
+
+RANEF_PATH = ROOT_DIR + "data/intermediaries/ranef_by_zipcode_{}.parquet"
+BBOX = (13.0, 52.3, 13.8, 52.7)
+
+# name -> (dataset, model kind, title) of the model assessment plots
+ASSESSMENTS = {
+    "rentals_model1": ("rentals", "ols", "Rentals: Non-Hierarchical Model"),
+    "rentals_model2": ("rentals", "mixedlm", "Rentals: Hierarchical Model"),
+    "sales_model1": ("sales", "ols", "Sales: Non-Hierarchical Model"),
+    "sales_model2": ("sales", "mixedlm", "Sales: Hierarchical Model"),
+}
+
+
+def style(font_size: int = 14) -> dict:
+    """rcParams of the report figures (plots.py uses 14pt, prediction_plots.py 16pt)."""
+    return {"font.family": "Arial", "font.size": font_size}
+
+
+def density_image(
+    ax,
+    layers: list,
+    extent: tuple,
+    alpha: float = 0.075,
+    marker_size: float = 36,
+    oversample: int = 3,
+    zorder=None,
+):
+    """
+    Draws point layers [(x, y, color), ...] as a single RGBA image instead of one marker per point.
+    Points are counted on a grid of `oversample` bins per axes pixel (3 matches dpi=300 exports),
+    spread over the footprint of a `marker_size` (pt^2) marker and composited like n overlapping
+    markers of opacity `alpha`: 1 - (1 - alpha)^n, with the layers' colors mixed by their counts
+    (as interleaved markers would be). Work after binning and the number of artists do not depend
+    on the number of points.
+    """
+    from matplotlib.colors import to_rgb
+    from scipy.signal import fftconvolve
+
+    bbox = ax.get_window_extent()
+    bins = (max(int(bbox.width * oversample), 1), max(int(bbox.height * oversample), 1))
+
+    # marker footprint in bins: the marker diameter is sqrt(marker_size) points
+    radius = np.sqrt(marker_size) / 72 * ax.figure.dpi * oversample / 2
+    offsets = np.arange(-int(radius), int(radius) + 1)
+    disk = (offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius**2).astype("float64")
+
+    total = np.zeros(bins)
+    rgb = np.zeros(bins + (3,))
+    for x, y, color in layers:
+        counts, _, _ = np.histogram2d(x, y, bins=bins, range=[extent[:2], extent[2:]])
+        counts = np.clip(fftconvolve(counts, disk, mode="same"), 0, None)
+        total += counts
+        rgb += counts[..., None] * to_rgb(color)
+
+    rgba = np.empty(bins + (4,))
+    rgba[..., :3] = rgb / np.maximum(total, 1e-12)[..., None]
+    rgba[..., 3] = 1 - (1 - alpha) ** total
+    return ax.imshow(
+        rgba.transpose(1, 0, 2),
+        extent=extent,
+        origin="lower",
+        aspect="auto",
+        interpolation="antialiased",
+        zorder=zorder,
+    )
+
+
+def binned_scatter(
+    ax,
+    data: pd.DataFrame,
+    x: str,
+    y: str,
+    hue: str = None,
+    palette=None,
+    color=DUKEBLUE,
+    alpha: float = 0.075,
+    xlim: tuple = None,
+    ylim: tuple = None,
+    zorder=None,
+):
+    """
+    Drop-in for `sns.scatterplot(data, x, y, hue, palette, alpha)` that draws all points as one
+    `density_image` (hue levels in sorted order, as seaborn does). Axis limits default to the data
+    range plus matplotlib's 5% margins.
+    """
+
+    def limits(values, lim):
+        if lim is not None:
+            return tuple(lim)
+        lo, hi = np.nanmin(values), np.nanmax(values)
+        pad = (hi - lo) * 0.05 or 0.5
+        return lo - pad, hi + pad
+
+    data = data.loc[data[[x, y]].notna().all(axis=1)]
+    xlim = limits(data[x].to_numpy(dtype="float64"), xlim)
+    ylim = limits(data[y].to_numpy(dtype="float64"), ylim)
+
+    if hue is None:
+        groups = [(None, data, color)]
+    else:
+        levels = sorted(data[hue].dropna().unique())
+        colors = palette if isinstance(palette, dict) else dict(zip(levels, palette))
+        groups = [(level, data.loc[data[hue] == level], colors[level]) for level in levels]
+
+    layers = [
+        (group[x].to_numpy(dtype="float64"), group[y].to_numpy(dtype="float64"), group_color)
+        for _, group, group_color in groups
+    ]
+    density_image(ax, layers, xlim + ylim, alpha=alpha, zorder=zorder)
+
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if hue is not None:
+        handles = [
+            plt.Line2D(
+                [], [], marker="o", linestyle="", color=group_color, alpha=alpha, label=str(level)
+            )
+            for level, _, group_color in groups
+        ]
+        ax.legend(handles=handles, title=hue)
+    return ax
+
+
+################## Descriptive plots (plots.py, appendix_plots.py) ##################
+def price_distribution(dfrent: pd.DataFrame, dfbuy: pd.DataFrame):
+    fig, axes = plt.subplots(1, 2, figsize=(12, 4))
+    sns.histplot(dfrent["price"], bins=50, color=DUKEBLUE, ax=axes[0])
+    sns.histplot(dfbuy["price"], bins=50, color=DUKEBLUE, ax=axes[1])
+
+    axes[0].xaxis.set_major_formatter(lambda x, _: f"{x:,.0f}")
+    axes[0].set_title("Rentals", weight="bold")
+    axes[1].xaxis.set_major_formatter(
+        lambda x, _: f"{x/1000:,.0f}k" if x < 1e6 else f"{x/1e6:,.1f}m"
+    )
+    axes[1].set_title("Sales", weight="bold")
+
+    # set labels and margins
+    _ = [ax.set_xlabel("Price (EUR)") for ax in axes]
+    _ = [ax.margins(x=0) for ax in axes]
+
+    fig.suptitle("Price Distribution of Listings", weight="bold")
+    sns.despine()
+    plt.tight_layout()
+    return fig
+
+
+def price_sqm_scatter(dfrent: pd.DataFrame, dfbuy: pd.DataFrame, binned: bool = True):
+    """
+    Price vs. size by private offer. `binned` draws the listings as density images
+    (`binned_scatter`) instead of one marker per listing.
+    """
+    fig, axes = plt.subplots(1, 2, figsize=(8, 4))
+    scatter = binned_scatter if binned else sns.scatterplot
+
+    scatter(
+        data=dfrent,
+        x="square_meters",
+        y="price",
+        hue="private_offer",
+        palette=[DUKEBLUE, "red"],
+        alpha=0.075,
+        ax=axes[0],
+    )
+
+    scatter(
+        data=dfbuy,
+        x="square_meters",
+        y="price",
+        hue="private_offer",
+        palette=[DUKEBLUE, "red"],
+        alpha=0.075,
+        ax=axes[1],
+    )
+
+    axes[0].set_xlabel("Size ($m^2$)")
+    axes[0].set_ylabel("Price")
+    sns.despine()
+    return fig
+
+
+def coefficient_frame(coefs: pd.DataFrame) -> pd.DataFrame:
+    """
+    One model's rows of the coefficient file (coefficients.py) as plotted by `compare_coefs`:
+    indexed by the shortened term name, with columns coef, std, tstat and pval.
+    """
+    return (
+        coefs.rename(
+            columns={
+                "term": "name",
+                "estimate": "coef",
+                "std_error": "std",
+                "t_value": "tstat",
+                "p_value": "pval",
+            }
+        )
+        .astype({"name": "string"})
+        .assign(name=lambda x: x["name"].str.replace("square_meters", "sqm"))
+        .assign(name=lambda x: x["name"].str.replace("object_type", "obj_type"))
+        .assign(name=lambda x: x["name"].str.replace("APARTMENT", "APT"))
+        .assign(name=lambda x: x["name"].str.replace("TEMPORARY", "TEMP"))
+        .set_index("name")[["coef", "std", "tstat", "pval"]]
+    )
+
+
+def compare_coefs(coef_rentals: pd.DataFrame, coef_sales: pd.DataFrame):
+    """Fixed effects of both hierarchical models, as returned by `coefficient_frame`."""
+    coef_sales = coef_sales.reindex(coef_rentals.index).reset_index()
+    coef_rentals = coef_rentals.reset_index()
+
+    # exclude the intercept
+    rentals_ex_intercept = coef_rentals.query("not name == '(Intercept)'")
+    sales_ex_intercept = coef_sales.query("not name == '(Intercept)'")
+
+    # order by rental coefficients
+    order = rentals_ex_intercept.sort_values("coef", ascending=True)["name"].tolist()
+
+    rentals_ex_intercept = rentals_ex_intercept.set_index("name").loc[order].reset_index()
+    sales_ex_intercept = sales_ex_intercept.set_index("name").loc[order].reset_index()
+
+    fig, ax = plt.subplots(figsize=(15, 5))
+    sns.pointplot(
+        data=rentals_ex_intercept,
+        x="name",
+        y="coef",
+        color=DUKEBLUE,
+        ci=None,
+        ax=ax,
+        join=False,
+        zorder=10,
+    )
+    sns.pointplot(
+        data=sales_ex_intercept,
+        x="name",
+        y="coef",
+        color="red",
+        ci=None,
+        ax=ax,
+        join=False,
+        zorder=10,
+    )
+    ax.errorbar(
+        y=rentals_ex_intercept["coef"],
+        yerr=rentals_ex_intercept["std"],
+        x=rentals_ex_intercept["name"],
+        color=DUKEBLUE,
+        zorder=5,
+        label="Rentals",
+    )
+    ax.errorbar(
+        y=sales_ex_intercept["coef"],
+        yerr=sales_ex_intercept["std"],
+        x=sales_ex_intercept["name"],
+        color="red",
+        zorder=5,
+        label="Sales",
+    )
+
+    ax.text(
+        x=16.5,
+        y=rentals_ex_intercept.query("name == 'obj_typeHOUSE'")["coef"].iloc[0],
+        s="Rentals",
+        va="center",
+        weight="bold",
+        color=DUKEBLUE,
+    )
+
+    ax.text(
+        x=16.5,
+        y=sales_ex_intercept.query("name == 'obj_typeHOUSE'")["coef"].iloc[0],
+        s="Sales",
+        va="center",
+        weight="bold",
+        color="red",
+    )
+
+    ratios = (
+        pd.DataFrame(
+            {
+                "name": sales_ex_intercept.name,
+                "ratio": sales_ex_intercept.coef / rentals_ex_intercept.coef,
+            }
+        )
+        .replace(np.inf, 1)
+        .set_index("name")
+        .to_dict()["ratio"]
+    )
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=35, ha="right", rotation_mode="anchor")
+    for lab in ax.get_xticklabels():
+        lab.set_y(lab.get_position()[1] - 0.02)
+        lab.set_alpha(1) if abs(float(ratios[lab.get_text()]) - 1) > 0.9 else lab.set_alpha(0.33)
+        (
+            lab.set_weight("bold")
+            if abs(float(ratios[lab.get_text()]) - 1) > 0.9
+            else lab.set_weight("normal")
+        )
+    ax.tick_params(left=False, bottom=True, size=10)
+
+    ax.set_ylabel("Coefficient")
+    ax.set_xlabel("")
+    ax.axhline(y=0, color="0.8", linestyle="--", zorder=-1)
+    sns.despine(bottom=True, left=True)
+    ax.set_title("Comparison of Fixed Effects for Rentals vs. Sales", weight="bold")
+    plt.tight_layout()
+    return fig
+
+
+def rooms_distribution(dfrent: pd.DataFrame, dfbuy: pd.DataFrame):
+    def hatch_missing(ax):
+        ax.patches[-1].set_hatch("///")
+
+    fig, axes = plt.subplots(1, 2, figsize=(12, 4), sharey=True)
+
+    colors = [DUKEBLUE] * 6 + ["0.8"]
+
+    sns.countplot(x=dfrent.rooms, ax=axes[0], color=DUKEBLUE, ec="k", palette=colors, zorder=10)
+    sns.countplot(x=dfbuy.rooms, ax=axes[1], color=DUKEBLUE, ec="k", palette=colors, zorder=10)
+
+    [hatch_missing(ax) for ax in axes]
+    [ax.grid("major", axis="y", ls="--", zorder=-1) for ax in axes]
+
+    axes[0].set_title("Rentals", weight="bold")
+    axes[1].set_title("Sales", weight="bold")
+
+    fig.suptitle("Number of Rooms", weight="bold")
+
+    plt.tight_layout()
+    sns.despine()
+    return fig
+
+
+################## Model plots (prediction_plots.py) ##################
+def model_assessment(model, df: pd.DataFrame, title: str, binned: bool = True):
+    """
+    Residuals vs. fitted values and QQ plot of `model` on `df`. Returns (fig, R^2).
+    `binned` draws the residuals as a density image (`binned_scatter`).
+    """
+    import scipy.stats as stats
+    import statsmodels.api as sm
+    from sklearn.metrics import r2_score
+
+    from ranef_predict import predict_with_ranef
+
+    preds = predict_with_ranef(model, df)
+
+    comp_df = pd.DataFrame(
+        {
+            "pred": preds,
+            "ytrue": np.log(df["price"]),
+        }
+    ).assign(delta=lambda df: df["ytrue"] - df["pred"])
+
+    fig, axes = plt.subplots(1, 2, figsize=(20, 6))
+
+    if binned:
+        binned_scatter(
+            axes[0], comp_df, "pred", "delta", color=DUKEBLUE, ylim=(-2.5, 2.5), zorder=10
+        )
+    else:
+        sns.scatterplot(
+            data=comp_df, x="pred", y="delta", alpha=0.075, ax=axes[0], color=DUKEBLUE, zorder=10
+        )
+    axes[0].axhline(0, color="0.7", linestyle="--", zorder=-1)
+    sns.despine()
+    axes[0].set_xlabel("Fitted Values")
+    axes[0].set_ylabel("Residuals")
+    axes[0].set_ylim(-2.5, 2.5)
+
+    sm.qqplot(
+        comp_df["delta"],
+        stats.norm(loc=comp_df["delta"].mean(), scale=comp_df["delta"].std()),
+        line="45",
+        ax=axes[1],
+        color=DUKEBLUE,
+    )
+
+    axes[1].set_xlim(-2, 2)
+
+    r2 = r2_score(np.log(df["price"]), preds)
+    fig.suptitle(f"{title}, $R^2$ = {r2:.2f}", size=18, weight="bold")
+    return fig, r2
+
+
+def predplot_rooms_objtype(model, df: pd.DataFrame):
+    """Mean predicted rent by number of rooms and object type."""
+    from ranef_predict import predict_with_ranef
+
+    preds = np.exp(predict_with_ranef(model, df))
+
+    _df = df.assign(preds=preds)
+
+    room_order = [
+        "Missing",
+        "Shared",
+        "1",
+        "2",
+        "3",
+        "4",
+        "5",
+    ]
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    palette = {
+        "APARTMENT": DUKEBLUE,
+        "HOUSE": "#95BF74",
+        "SHARED_APARTMENT": "#48BEFF",
+        "TEMPORARY_LIVING": "#659B5E",
+        "HOLIDAY_HOUSE_APARTMENT": "white",
+    }
+    sns.pointplot(
+        data=_df,
+        x="rooms",
+        y="preds",
+        hue="object_type",
+        palette=palette,
+        ax=ax,
+        order=room_order,
+    )
+
+    label_yvals = (
+        _df.query("rooms == '5'").groupby("object_type")["preds"].mean().dropna().to_dict()
+    )
+    label_yvals["APARTMENT"] = label_yvals["APARTMENT"] * 0.9
+    label_yvals["HOUSE"] = label_yvals["HOUSE"] * 1.025
+    label_yvals["TEMPORARY_LIVING"] = label_yvals["TEMPORARY_LIVING"] * 0.9
+    label_yvals["SHARED_APARTMENT"] = label_yvals["SHARED_APARTMENT"] * 1.1
+
+    for label, yval in label_yvals.items():
+        ax.text(6.2, yval, label, verticalalignment="center", weight="bold", color=palette[label])
+
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda y, _: "€{:,.0f}".format(y)))
+    ax.set_xlabel("Number of Rooms")
+    ax.set_ylabel("Rent Price")
+    ax.set_title("Predicted Rent Price by Number of Rooms", weight="bold")
+    ax.grid(axis="y", ls="--")
+    ax.set_xlim(0, 6.1)
+    ax.legend([], frameon=False)
+    plt.tight_layout()
+    sns.despine()
+    return fig
+
+
+################## Random Effects by ZIP ##################
+def merge_significance(type_: str, geodf):
+    """zip areas of `geodf` joined with the random-intercept significance table of `type_`."""
+    from ranef_significance import load_significance
+
+    # CI bounds & significance are computed vectorized and cached next to the ranef parquet
+    df_dotplot = load_significance(RANEF_PATH.format(type_), z=1.96).sort_values(by="pointestimate")
+    df_dotplot["zip"] = df_dotplot["zip"].astype("category")
+
+    df_dotplot = df_dotplot.assign(sig=df_dotplot["pointestimate_sig"])
+
+    merged = pd.merge(geodf.rename({"plz": "zip"}, axis=1), df_dotplot, on="zip", how="left")
+    with span("reprojection", rows=len(merged)):
+        return merged.to_crs(4326)
+
+
+def plot_geoplot(type_: str, fig, ax, geodf):
+    """type = "rentals" or "sales" """
+    import geopandas as gpd
+    from matplotlib_scalebar.scalebar import ScaleBar
+    from shapely.geometry.point import Point
+
+    from road_cache import load_roads
+
+    merged = merge_significance(type_, geodf)
+
+    fclasses = (
+        "motorway",
+        "motorway_link",
+        "primary",
+        "secondary",
+        "tertiary",
+    )
+
+    # indexed per-fclass road store, read once per process and shared by both panels
+    streets = load_roads(fclasses, BBOX)
+
+    merged.plot(
+        column="pointestimate_sig",
+        ax=ax,
+        edgecolor="black",
+        linewidth=0.75,
+        missing_kwds={"color": "0.95", "hatch": "..."},
+    )
+    ax.set_xticklabels(())
+    ax.set_yticklabels(())
+    ax.set_xticks(())
+    ax.set_yticks(())
+    ax.set_title(type_.capitalize(), weight="bold", size=20, family="Arial")
+    sns.despine(left=True, bottom=True)
+
+    # Scalebar - Need to calculate ratio from pixels to real world
+    points = gpd.GeoSeries([Point(-73.5, 40.5), Point(-74.5, 40.5)], crs=4326)
+    points = points.to_crs(32619)
+    distance_meters = points[0].distance(points[1])
+    ax.add_artist(ScaleBar(distance_meters, location="lower left"))
+
+    plt.tight_layout()
+
+    fig.colorbar(ax.collections[0], ax=ax, label="Random Intercept", shrink=0.75)
+
+    streets.plot(color="0.8", ax=ax, zorder=-1)
+    ax.set_xlim(13, 13.8)
+    ax.set_ylim(52.3, 52.7)
+
+    return merged
+
+
+def geoplot_rentals_and_sales(geodf):
+    """Returns (fig, merged_rentals, merged_sales)."""
+    fig, axes = plt.subplots(1, 2, figsize=(15, 6))
+    merged_rentals = plot_geoplot("rentals", fig, axes[0], geodf)
+    merged_sales = plot_geoplot("sales", fig, axes[1], geodf)
+    return fig, merged_rentals, merged_sales
+
+
+def create_dist_to_mitte_plot(merged_df, ax, title, zip_geometry: pd.DataFrame = None):
+    import statsmodels.formula.api as smf
+
+    from zip_geometry import lookup
+
+    # distances come from the cached zip geometry table instead of a reprojection + spatial join
+    with span("dist_to_mitte_lookup", rows=len(merged_df)):
+        mitte_df = merged_df.assign(dist_to_mitte=lookup(merged_df["zip"], table=zip_geometry))
+
+    # calculate cheap & expensive points
+    regline = smf.ols("np.exp(pointestimate_sig) ~ dist_to_mitte", data=mitte_df).fit()
+    preds = regline.predict(mitte_df)
+    deltas = np.exp(mitte_df["pointestimate_sig"]) - preds
+    expensive_cutoff = np.nanquantile(deltas, 0.975)
+    cheap_cutoff = np.nanquantile(deltas, 0.025)
+
+    # plot
+    sns.scatterplot(
+        data=mitte_df.loc[deltas > expensive_cutoff, :],
+        color="red",
+        x="dist_to_mitte",
+        y=np.exp(mitte_df["pointestimate_sig"]),
+        ax=ax,
+    )
+    sns.scatterplot(
+        data=mitte_df.loc[deltas < cheap_cutoff, :],
+        color="green",
+        x="dist_to_mitte",
+        y=np.exp(mitte_df["pointestimate_sig"]),
+        ax=ax,
+    )
+    sns.scatterplot(
+        data=mitte_df.loc[(deltas < expensive_cutoff) & (deltas > cheap_cutoff), :],
+        color=DUKEBLUE,
+        x="dist_to_mitte",
+        y=np.exp(mitte_df["pointestimate_sig"]),
+        ax=ax,
+    )
+
+    # details
+    ax.axhline(1, color="0.7", linestyle="--")
+    good_deal = mitte_df.loc[deltas < cheap_cutoff, "zip"].values
+
+    _annot_df = mitte_df.query("zip.isin(@good_deal)")
+    for x, y, zipcode in zip(
+        _annot_df["dist_to_mitte"],
+        np.exp(_annot_df["pointestimate_sig"]),
+        _annot_df["zip"],
+    ):
+        ax.text(x - 0.25, y, str(zipcode), ha="right", va="center", size=10)
+
+    ax.set_title(title, weight="bold")
+    ax.set_xlabel("Distance to Mitte (km)")
+    ax.set_ylabel("Multiplicative Price Effect")
+
+
+def dist_to_mitte(merged_rentals, merged_sales, zip_geometry: pd.DataFrame = None):
+    fig, axes = plt.subplots(1, 2, figsize=(15, 5))
+    create_dist_to_mitte_plot(merged_rentals, axes[0], "Rentals", zip_geometry)
+    create_dist_to_mitte_plot(merged_sales, axes[1], "Sales", zip_geometry)
+
+    fig.suptitle("Distance to Mitte (km) vs. Multiplicative Price Effect", weight="bold")
+    sns.despine()
+    plt.tight_layout()
+    return fig
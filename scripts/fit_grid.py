@@ -0,0 +1,103 @@
+"""
+Fits the (dataset x formula x model kind) grid across a process pool.
+
+    python fit_grid.py --workers 4 --refit
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from arrow_store import materialize
+from model_store import DATASETS, FORMULA, artifact_path, load_or_fit
+from tracing import TRACER, init_worker
+
+FORMULAS = {
+    "interaction": FORMULA,
+    "additive": "np.log(price) ~ object_type + private_offer + rooms + square_meters",
+}
+KINDS = ["ols", "mixedlm"]
+
+
+def fit_one(dataset: str, formula_name: str, formula: str, kind: str, refit: bool = False) -> dict:
+    """Fits (or loads) a single grid cell. Runs inside a worker process."""
+    data_path = DATASETS[dataset]
+    grouped = kind in ("mixedlm", "reml")
+    path = artifact_path(formula, data_path, kind, "zip_code" if grouped else None)
+    cached = os.path.exists(path) and not refit
+
+    start = time.perf_counter()
+    model = load_or_fit(formula, data_path, kind=kind, refit=refit)
+    return {
+        "dataset": dataset,
+        "formula": formula_name,
+        "kind": kind,
+        "nobs": model.nobs,
+        "n_params": len(model.params),
+        "scale": model.scale,
+        "cov_re": model.cov_re,
+        "cached": cached,
+        "fit_seconds": time.perf_counter() - start,
+        "model": model,
+    }
+
+
+def fit_grid(
+    datasets=tuple(DATASETS),
+    formulas: dict = FORMULAS,
+    kinds=KINDS,
+    max_workers: int = None,
+    refit: bool = False,
+):
+    """
+    Fits every combination of `datasets`, `formulas` (name -> formula) and `kinds` in parallel.
+    Returns a table with one row per fit (incl. wall time) and a dict
+    (dataset, formula name, kind) -> StoredModel.
+
+    Called from a worker process, the grid is fitted in-process instead. This is the case when a
+    script calls `fit_grid` at module level (prediction_plots.py) and is re-imported by the workers
+    of the spawn start method (the default on macOS and Windows), which may not start a pool.
+    """
+    grid = list(itertools.product(datasets, formulas.items(), kinds))
+    # write the memory-mapped listings once here instead of racing to do so in the workers
+    for dataset in datasets:
+        materialize(DATASETS[dataset])
+    if multiprocessing.current_process().name != "MainProcess":
+        rows = [
+            fit_one(dataset, name, formula, kind, refit) for dataset, (name, formula), kind in grid
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers or min(len(grid), os.cpu_count()),
+            initializer=init_worker,
+            initargs=(TRACER.worker_config(),),
+        ) as pool:
+            futures = [
+                pool.submit(fit_one, dataset, name, formula, kind, refit)
+                for dataset, (name, formula), kind in grid
+            ]
+            rows = [future.result() for future in futures]
+
+    models = {(row["dataset"], row["formula"], row["kind"]): row.pop("model") for row in rows}
+    return pd.DataFrame(rows), models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the dataset x formula x model grid")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--refit", action="store_true", help="ignore stored artifacts")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table, _ = fit_grid(max_workers=args.workers, refit=args.refit)
+    print(table.to_string(index=False))
+    print(f"total wall time: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
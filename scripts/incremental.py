@@ -0,0 +1,365 @@
+"""
+Incremental model updates for listings appended to dfrent.parquet / dfbuy.parquet.
+
+    python incremental.py rentals sales
+
+Both models are kept as sufficient statistics on disk: X'X, X'y, y'y and, per zip code, the
+listing count and the sums of X and y (plus X'X, X'y and y'y of the listings without a zip code of
+plz.geojson, which the OLS model includes and the random-intercept model leaves out). The rows
+appended since the last run are added to them exactly, so the cost of an update scales with the
+new batch, not with the history. The OLS model is solved from X'X and X'y; the random-intercept
+model is the REML fit of `random_intercept` on the same statistics (the estimates of statsmodels'
+MixedLM), so the source file is never re-read.
+
+The fitted models are written to the model store under a key of the accumulated state (number of
+rows consumed and a chained digest of the consumed batches), not of the whole source file, and are
+read back with `load_updated`.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import scipy.stats as stats
+
+from data_access import MODEL_COLUMNS
+from leverage import STAGES
+from model_store import ARTIFACT_VERSION, FORMULA, ROOT_DIR, STORE_DIR, StoredModel, catcols
+from schema import apply_schema
+from scoring import DesignEncoder
+
+# same sources and row exclusions as the leverage stage (e.g. no "Shared" rooms among sales)
+SOURCES = {name: ROOT_DIR + stage["source"] for name, stage in STAGES.items()}
+COLUMNS = MODEL_COLUMNS
+
+# bump whenever the layout of the statistics file changes; older files are rebuilt from scratch
+STATS_VERSION = 3
+
+
+def read_appended(path: str, rows_seen: int):
+    """
+    Reads only the rows of `path` after the first `rows_seen` ones, skipping fully seen row groups.
+    Returns the new rows and the total row count of the file.
+    """
+    pf = pq.ParquetFile(path)
+    tables, offset = [], 0
+    for i in range(pf.num_row_groups):
+        n_rows = pf.metadata.row_group(i).num_rows
+        if offset + n_rows > rows_seen:
+            table = pf.read_row_group(i, columns=COLUMNS)
+            tables.append(table.slice(max(rows_seen - offset, 0)))
+        offset += n_rows
+    schema = pf.schema_arrow
+    table = pa.concat_tables(tables) if tables else schema.empty_table().select(COLUMNS)
+    return apply_schema(table.to_pandas()), offset
+
+
+def batch_digest(previous: str, df: pd.DataFrame) -> str:
+    """Digest of all batches consumed so far: `previous` chained with the values of batch `df`."""
+    digest = hashlib.sha256(previous.encode())
+    digest.update(pd.util.hash_pandas_object(df[COLUMNS], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def model_rows(df: pd.DataFrame, exclude_rooms=()) -> pd.DataFrame:
+    """Rows usable for `np.log(price) ~ ...` (patsy drops missing values, log needs price > 0)."""
+    # zip_code is not a predictor: listings without one stay in (the OLS model)
+    df = df.dropna(subset=[col for col in COLUMNS if col != "zip_code"])
+    return df.loc[(df["price"] > 0) & ~df["rooms"].isin(exclude_rooms)]
+
+
+class SufficientStats:
+    """
+    X'X, X'y, y'y and per-zip counts and sums of the model `formula`, with a fixed design layout
+    `names`. `ungrouped` holds X'X, X'y, y'y and the count of the listings without a zip code.
+    Values outside the `levels` of the design raise a ValueError when a batch is added: encoding
+    them like the reference level would make the update inexact.
+    """
+
+    def __init__(
+        self,
+        formula,
+        names,
+        levels,
+        xtx,
+        xty,
+        yty=0.0,
+        n=0,
+        zip_counts=None,
+        zip_sums=None,
+        ungrouped=None,
+        rows_seen=0,
+        digest="",
+    ):
+        self.formula = formula
+        self.encoder = DesignEncoder(names, levels)
+        self.levels = levels
+        self.xtx = xtx
+        self.xty = xty
+        self.yty = yty
+        self.n = n
+        self.zip_counts = zip_counts if zip_counts is not None else pd.Series(dtype="int64")
+        # per zip code: column sums of X and (last column) the sum of y
+        self.zip_sums = (
+            zip_sums if zip_sums is not None else pd.DataFrame(columns=range(len(xty) + 1))
+        )
+        self.ungrouped = (
+            ungrouped
+            if ungrouped is not None
+            else {"xtx": np.zeros_like(xtx), "xty": np.zeros_like(xty), "yty": 0.0, "n": 0}
+        )
+        self.rows_seen = rows_seen
+        self.digest = digest
+
+    @classmethod
+    def initial(cls, df: pd.DataFrame, formula: str = FORMULA):
+        """
+        Derives the design layout (column names and levels) from a first batch of listings.
+        All levels of the fixed schema dictionaries are kept, even those without listings yet, so
+        that later batches containing them are encoded exactly.
+        """
+        import patsy
+
+        names = patsy.dmatrix(formula.split("~", 1)[1], df).design_info.column_names
+        levels = {col: df[col].cat.categories.tolist() for col in catcols}
+        levels["private_offer"] = [False, True]
+        p = len(names)
+        return cls(formula, names, levels, np.zeros((p, p)), np.zeros(p))
+
+    @property
+    def names(self) -> list:
+        return self.encoder.names
+
+    def add(self, df: pd.DataFrame):
+        """Adds a batch of listings to the statistics."""
+        df = model_rows(df)
+        X = self.encoder.encode_batch({col: df[col].to_numpy() for col in self.encoder.columns})
+        y = np.log(df["price"].to_numpy(dtype="float64"))
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.yty += float(y @ y)
+        self.n += len(y)
+
+        grouped = df["zip_code"].notna().to_numpy()
+        self.ungrouped["xtx"] += X[~grouped].T @ X[~grouped]
+        self.ungrouped["xty"] += X[~grouped].T @ y[~grouped]
+        self.ungrouped["yty"] += float(y[~grouped] @ y[~grouped])
+        self.ungrouped["n"] += int((~grouped).sum())
+
+        X, y = X[grouped], y[grouped]
+        zip_codes = df["zip_code"].to_numpy()[grouped].astype(str)
+        counts = pd.Series(zip_codes).value_counts()
+        self.zip_counts = self.zip_counts.add(counts, fill_value=0).astype("int64")
+        sums = pd.DataFrame(np.column_stack([X, y]), index=zip_codes).groupby(level=0).sum()
+        self.zip_sums = self.zip_sums.add(sums, fill_value=0).loc[self.zip_counts.index]
+
+    def _active(self) -> np.ndarray:
+        """Design columns with listings so far (levels without any have an all-zero column)."""
+        return np.diag(self.xtx) > 0
+
+    def _fitted_levels(self, active: np.ndarray) -> dict:
+        """`levels`, without the levels of categorical predictors that have no listings so far."""
+        names = {name for name, keep in zip(self.names, active) if keep}
+        levels = dict(self.levels)
+        for col in self.encoder.categorical:
+            reference, *others = self.levels[col]
+            levels[col] = [reference] + [lvl for lvl in others if f"{col}[T.{lvl}]" in names]
+        return levels
+
+    def solve_ols(self) -> StoredModel:
+        """Exact OLS solution from the accumulated statistics."""
+        active = self._active()
+        xtx = self.xtx[np.ix_(active, active)]
+        xtx_inv = np.linalg.pinv(xtx)
+        params = xtx_inv @ self.xty[active]
+        rss = self.yty - 2 * params @ self.xty[active] + params @ xtx @ params
+        df_resid = self.n - np.linalg.matrix_rank(xtx)
+        scale = rss / df_resid
+        bse = np.sqrt(np.clip(np.diag(xtx_inv), 0, None) * scale)
+        tvalues = params / bse
+        index = pd.Index(self.names)[active]
+        return StoredModel(
+            formula=self.formula,
+            kind="ols",
+            params=pd.Series(params, index=index),
+            bse=pd.Series(bse, index=index),
+            tvalues=pd.Series(tvalues, index=index),
+            pvalues=pd.Series(2 * stats.t.sf(np.abs(tvalues), df_resid), index=index),
+            levels=self._fitted_levels(active),
+            scale=float(scale),
+            nobs=int(self.n),
+        )
+
+    def solve_reml(self) -> StoredModel:
+        """
+        REML random-intercept (per zip code) fit from the accumulated statistics, on the listings
+        with a zip code.
+        """
+        from random_intercept import fit_statistics, stored_model
+
+        xtx = self.xtx - self.ungrouped["xtx"]
+        sums = self.zip_sums.to_numpy(dtype="float64")
+        # design columns with listings among those with a zip code (exact, unlike the difference)
+        active = np.abs(sums[:, :-1]).sum(axis=0) > 0
+        nobs = self.n - self.ungrouped["n"]
+        fit = fit_statistics(
+            {
+                "XtX": xtx[np.ix_(active, active)],
+                "Xty": (self.xty - self.ungrouped["xty"])[active],
+                "yty": self.yty - self.ungrouped["yty"],
+                "n": self.zip_counts.to_numpy(dtype="float64"),
+                "S": sums[:, :-1][:, active],
+                "t": sums[:, -1],
+                "nobs": nobs,
+            }
+        )
+        names = pd.Index(self.names)[active]
+        return stored_model(
+            fit, self.formula, names, self._fitted_levels(active), self.zip_counts.index, nobs
+        )
+
+    def model_path(self, name: str, kind: str, store_dir: str = STORE_DIR) -> str:
+        """Model store path of the `kind` model of this state (keyed by the consumed batches)."""
+        digest = hashlib.sha256()
+        for part in (str(ARTIFACT_VERSION), kind, self.formula, str(self.rows_seen), self.digest):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return os.path.join(store_dir, f"{name}_incremental_{kind}_{digest.hexdigest()[:20]}.npz")
+
+    def save(self, path: str):
+        meta = {
+            "version": STATS_VERSION,
+            "formula": self.formula,
+            "levels": self.levels,
+            "yty": self.yty,
+            "n": self.n,
+            "ungrouped_yty": self.ungrouped["yty"],
+            "ungrouped_n": self.ungrouped["n"],
+            "rows_seen": self.rows_seen,
+            "digest": self.digest,
+        }
+        arrays = {
+            "meta": np.array(json.dumps(meta)),
+            "names": np.array(self.names, dtype="str"),
+            "xtx": self.xtx,
+            "xty": self.xty,
+            "zip_codes": self.zip_counts.index.to_numpy(dtype="str"),
+            "zip_counts": self.zip_counts.to_numpy(),
+            "zip_sums": self.zip_sums.to_numpy(dtype="float64"),
+            "ungrouped_xtx": self.ungrouped["xtx"],
+            "ungrouped_xty": self.ungrouped["xty"],
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """The statistics stored at `path`, or None if they were written by an older layout."""
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["meta"]))
+            if meta.get("version") != STATS_VERSION:
+                return None
+            zip_codes = npz["zip_codes"].tolist()
+            return cls(
+                meta["formula"],
+                npz["names"].tolist(),
+                meta["levels"],
+                npz["xtx"],
+                npz["xty"],
+                meta["yty"],
+                meta["n"],
+                pd.Series(npz["zip_counts"], index=zip_codes, dtype="int64"),
+                pd.DataFrame(npz["zip_sums"], index=zip_codes),
+                {
+                    "xtx": npz["ungrouped_xtx"],
+                    "xty": npz["ungrouped_xty"],
+                    "yty": meta["ungrouped_yty"],
+                    "n": meta["ungrouped_n"],
+                },
+                meta["rows_seen"],
+                meta["digest"],
+            )
+
+
+def stats_path(name: str, store_dir: str = STORE_DIR) -> str:
+    return os.path.join(store_dir, f"{name}_stats.npz")
+
+
+def update(name: str, source: str = None, store_dir: str = STORE_DIR):
+    """
+    Adds the rows appended to `source` since the last update to the stored statistics of `name`
+    and returns (statistics, n new rows).
+    """
+    source = source or SOURCES[name]
+    path = stats_path(name, store_dir)
+    state = SufficientStats.load(path) if os.path.exists(path) else None
+
+    new_rows, total = read_appended(source, state.rows_seen if state else 0)
+    if state is not None and total < state.rows_seen:
+        # the file was rewritten rather than appended to: start over
+        state = None
+        new_rows, total = read_appended(source, 0)
+    digest = batch_digest(state.digest if state else "", new_rows)
+    new_rows = model_rows(new_rows, STAGES[name]["exclude_rooms"])
+    if state is None:
+        state = SufficientStats.initial(new_rows)
+
+    state.add(new_rows)
+    state.rows_seen = total
+    state.digest = digest
+    state.save(path)
+    return state, len(new_rows)
+
+
+def update_ols(name: str, source: str = None, store_dir: str = STORE_DIR):
+    """
+    Updates the statistics of `name` with the appended rows, writes the solved OLS model to the
+    model store and returns (statistics, model, n new rows).
+    """
+    state, n_new = update(name, source, store_dir)
+    model = state.solve_ols()
+    model.save(state.model_path(name, "ols", store_dir))
+    return state, model, n_new
+
+
+def update_mixedlm(name: str, store_dir: str = STORE_DIR) -> StoredModel:
+    """
+    Fits the random-intercept model of `name` by REML from the stored statistics (no data is read)
+    and writes it to the model store.
+    """
+    state = SufficientStats.load(stats_path(name, store_dir))
+    model = state.solve_reml()
+    model.save(state.model_path(name, "reml", store_dir))
+    return model
+
+
+def load_updated(name: str, kind: str = "ols", store_dir: str = STORE_DIR) -> StoredModel:
+    """The `kind` ("ols" or "reml") model of the latest update of `name`."""
+    state = SufficientStats.load(stats_path(name, store_dir))
+    return StoredModel.load(state.model_path(name, kind, store_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the models with newly appended listings")
+    parser.add_argument("names", nargs="*", help=f"any of {', '.join(SOURCES)} (default: all)")
+    parser.add_argument("--skip-mixedlm", action="store_true")
+    args = parser.parse_args()
+
+    for name in args.names or SOURCES:
+        state, model, n_new = update_ols(name)
+        print(f"{name}: {n_new} new rows, OLS on {state.n} listings, scale={model.scale:.4f}")
+        if not args.skip_mixedlm:
+            mixed = update_mixedlm(name)
+            print(f"{name}: random intercept, cov_re={mixed.cov_re:.4f}, scale={mixed.scale:.4f}")
+
+
+if __name__ == "__main__":
+    main()
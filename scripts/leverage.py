@@ -0,0 +1,194 @@
+"""
+Recomputes the *_leverage_removed intermediaries from the cleaned listings.
+
+    python leverage.py              # data/intermediaries/{rentals,sales}_leverage_removed.parquet
+    python leverage.py --dry-run    # only prints the threshold report
+    python leverage.py --recompute  # Cook's distance rounds -> *_leverage_recomputed.parquet
+
+Mirrors the R analysis scripts: drop square_meters outliers above the 99.9th percentile, fit model0
+and remove influential points in one or more refit rounds. By default the rows removed are those
+of the R scripts (1-based positions in the frame of each round), which reproduces the published
+intermediaries exactly; an unchanged intermediary is not rewritten. With `--recompute`, every
+round removes the points with the largest Cook's distance instead. From the second sales round on
+these differ from R's (R's positions were read off plots labelled with the original row names),
+so the result goes to a separate file and never replaces the published data.
+Hat values and Cook's distances come from a thin QR decomposition of the n x p design matrix,
+so memory stays O(n * p) and the n x n hat matrix is never formed.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import patsy
+import pyarrow.parquet as pq
+import scipy.linalg
+
+from model_store import FACTORS, ROOT_DIR
+
+# model0 of the R scripts
+INFLUENCE_FORMULA = "np.log(price) ~ object_type + private_offer + rooms + square_meters"
+
+# source file, rows excluded before fitting and the rows removed per refit round (1-based positions
+# of `problematic` in analysis_script_rentals.R / analysis_script_sales.R)
+STAGES = {
+    "rentals": {
+        "source": "data/dfrent.parquet",
+        "exclude_rooms": [],
+        "removals": [[23065, 14691, 30143]],
+    },
+    "sales": {
+        "source": "data/dfbuy.parquet",
+        "exclude_rooms": ["Shared"],
+        "removals": [
+            [747, 1048, 22411, 90, 12780],
+            [3397, 20318, 10983, 7696],
+            [17272, 27480, 2240],
+        ],
+    },
+}
+
+
+def influence(X: np.ndarray, y: np.ndarray) -> pd.DataFrame:
+    """
+    Returns hat values, studentized residuals and Cook's distance of the least-squares fit of y on X.
+    Uses a rank-revealing thin QR, so rank-deficient designs (e.g. empty dummy columns) are handled.
+    """
+    Q, R, _ = scipy.linalg.qr(X, mode="economic", pivoting=True)
+    diag = np.abs(np.diag(R))
+    rank = int((diag > diag[0] * max(X.shape) * np.finfo(float).eps).sum())
+    Q = Q[:, :rank]
+
+    n = X.shape[0]
+    hat = np.einsum("ij,ij->i", Q, Q)
+    resid = y - Q @ (Q.T @ y)
+    sigma2 = resid @ resid / (n - rank)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        student = resid / np.sqrt(sigma2 * (1 - hat))
+        cooks = student**2 * hat / (rank * (1 - hat))
+    # points that alone determine a coefficient (hat == 1) are maximally influential
+    cooks = np.where(hat >= 1 - 1e-10, np.inf, cooks)
+    return pd.DataFrame({"hat": hat, "student_resid": student, "cooks_d": cooks})
+
+
+def remove_influential(
+    df: pd.DataFrame, rounds: list, formula: str = INFLUENCE_FORMULA, removals: list = None
+):
+    """
+    Removes the `k` rows with the largest Cook's distance for every `k` in `rounds`, refitting in
+    between, or the given 1-based row positions of every round in `removals`. Returns the remaining
+    rows and a per-round report (incl. the `k` largest Cook's distances either way).
+    """
+    report = []
+    for r, k in enumerate(rounds):
+        y, X = patsy.dmatrices(formula, df, return_type="matrix", NA_action="raise")
+        infl = influence(np.asarray(X), np.asarray(y).ravel())
+        n, p = X.shape
+        largest = np.argsort(-infl["cooks_d"].to_numpy(), kind="stable")[:k]
+        worst = largest if removals is None else np.asarray(removals[r]) - 1
+        report.append(
+            {
+                "n": n,
+                "p": p,
+                "largest_cooks_d": [int(df.index[row]) for row in largest],
+                "removed": [
+                    {"row": int(df.index[i]), **{c: float(infl.iloc[i][c]) for c in infl.columns}}
+                    for i in worst
+                ],
+                "max_hat": float(infl["hat"].max()),
+                "n_hat_above_2p_n": int((infl["hat"] > 2 * p / n).sum()),
+                "n_cooks_above_4_n": int((infl["cooks_d"] > 4 / n).sum()),
+                "n_cooks_above_0.5": int((infl["cooks_d"] > 0.5).sum()),
+            }
+        )
+        df = df.drop(index=df.index[worst])
+    return df, report
+
+
+def _same_rows(path: str, df: pd.DataFrame) -> bool:
+    """Whether the parquet file at `path` holds the values of `df` (category dictionaries aside)."""
+    if not os.path.exists(path):
+        return False
+    try:
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(path), df, check_dtype=False, check_categorical=False
+        )
+    except AssertionError:
+        return False
+    return True
+
+
+def run_stage(name: str, write: bool = True, recompute: bool = False) -> dict:
+    stage = STAGES[name]
+    # the raw values (no schema dictionaries), so that the output keeps the published zip codes
+    df = pq.read_table(ROOT_DIR + stage["source"]).to_pandas()
+    n_source = len(df)
+
+    # same as R's quantile(..., 0.999, na.rm=TRUE) + filter(), which also drops missing sizes
+    cutoff = float(np.nanquantile(df["square_meters"], 0.999))
+    df = df.loc[(df["square_meters"] <= cutoff) & ~df["rooms"].isin(stage["exclude_rooms"])]
+    df = df.reset_index(drop=True)
+    n_filtered = len(df)
+
+    design = df.assign(**{col: df[col].cat.remove_unused_categories() for col in FACTORS})
+    removals = None if recompute else stage["removals"]
+    remaining, rounds = remove_influential(
+        design, [len(rows) for rows in stage["removals"]], removals=removals
+    )
+    df = df.loc[remaining.index].reset_index(drop=True)
+
+    report = {
+        "stage": name,
+        "source": stage["source"],
+        "formula": INFLUENCE_FORMULA,
+        "square_meters_quantile": 0.999,
+        "square_meters_cutoff": cutoff,
+        "n_source": n_source,
+        "n_after_cutoff": n_filtered,
+        "removed_by": "cooks_d" if recompute else "r_scripts",
+        "rounds": rounds,
+        "n_output": len(df),
+    }
+    if write:
+        suffix = "recomputed" if recompute else "removed"
+        out = ROOT_DIR + f"data/intermediaries/{name}_leverage_{suffix}"
+        if not _same_rows(out + ".parquet", df):
+            df.to_parquet(out + ".parquet")
+        with open(out + "_report.json", "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the *_leverage_removed intermediaries")
+    parser.add_argument("stages", nargs="*", help=f"any of {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="print the report, write nothing")
+    parser.add_argument(
+        "--recompute",
+        action="store_true",
+        help="remove the largest Cook's distances instead of the R scripts' rows (separate file)",
+    )
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    for name in args.stages or STAGES:
+        report = run_stage(name, write=not args.dry_run, recompute=args.recompute)
+        print(
+            f"{name}: {report['n_source']} listings -> {report['n_after_cutoff']} after "
+            f"square_meters <= {report['square_meters_cutoff']:.2f} -> {report['n_output']}"
+        )
+        for i, rnd in enumerate(report["rounds"], 1):
+            removed = ", ".join(f"{r['row']} (D={r['cooks_d']:.3g})" for r in rnd["removed"])
+            print(
+                f"  round {i}: n={rnd['n']}, p={rnd['p']}, max hat={rnd['max_hat']:.3f}, "
+                f"D>4/n: {rnd['n_cooks_above_4_n']}, D>0.5: {rnd['n_cooks_above_0.5']}, "
+                f"removed rows {removed}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,17 @@
 #%%
-import pandas as pd
+from missingness import profile_missingness
 
-#%%
-df = pd.read_parquet("../data/berlin_clean.parquet")
-
-df.isna().melt(value_vars=df.columns).pivot_table(
-    index="variable", columns="variable", values="value", aggfunc="sum"
-).fillna(0).style.background_gradient(cmap="coolwarm")
-
-#%%
-import polars as pl
+# streams null masks only: O(k^2) memory beyond one batch instead of an n*k-row melt
+profile = profile_missingness("../data/berlin_clean.parquet")
 
 #%%
-pdf = pl.read_parquet("../data/berlin_clean.parquet")
+profile.co_missing.style.background_gradient(cmap="coolwarm")
 
 #%%
+profile.null_rates.sort_values(ascending=False)
 
 #%%
-pdf.with_columns([pl.col(c).is_null().alias(c) for c in pdf.columns]).melt(
-    id_vars=pdf.columns, value_vars=pdf.columns
-).with_column(pl.col("value").cast(pl.UInt8)).groupby("variable").pivot("variable", "value").sum()
+profile.correlation().style.background_gradient(cmap="coolwarm", vmin=-1, vmax=1)
 
 #%%
-pdf.with_columns(pl.col("*").is_nan()).sum()
-
-#%%
-
-import os
-
-os.environ["MODIN_ENGINE"] = "ray"
-import modin.pandas as pd
-
-
-df = pd.read_parquet("../data/berlin_clean.parquet")
-
-#%%
-
-df.isna().melt(value_vars=df.columns).pivot_table(
-    index="variable", columns="variable", values="value", aggfunc="sum"
-).fillna(0).style.background_gradient(cmap="coolwarm")
+profile.patterns(top=20)
@@ -0,0 +1,158 @@
+"""
+Streaming missingness profile of a parquet file: per-column null rates, the co-missing count
+matrix and the frequencies of the row missingness patterns.
+
+    python missingness.py ../data/berlin_clean.parquet --patterns 20
+
+The file is read in column-projected record batches and only the null masks are kept. For the
+boolean null matrix M of a batch (rows x k columns), M^T M holds the number of rows in which
+columns i and j are both missing (the diagonal is the null count), so the profile only grows with
+k^2 plus the number of distinct patterns, never with the number of rows.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+
+class MissingnessProfile:
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.n_rows = 0
+        self.co_missing_counts = np.zeros((len(self.columns), len(self.columns)), dtype="int64")
+        # bit-packed pattern (bytes) -> number of rows
+        self.pattern_counts = {}
+
+    def update(self, mask: np.ndarray):
+        """Adds a boolean null mask of shape (rows, k), columns in the order of `self.columns`."""
+        mask = np.asarray(mask, dtype=bool)
+        if not len(mask):
+            return self
+        m = mask.astype("float64")
+        # float BLAS product, exact for any batch below 2**53 rows
+        self.co_missing_counts += np.rint(m.T @ m).astype("int64")
+        self.n_rows += len(mask)
+
+        packed = np.ascontiguousarray(np.packbits(mask, axis=1))
+        patterns, counts = np.unique(
+            packed.view(np.dtype((np.void, packed.shape[1]))).ravel(), return_counts=True
+        )
+        for pattern, count in zip(patterns, counts):
+            key = pattern.tobytes()
+            self.pattern_counts[key] = self.pattern_counts.get(key, 0) + int(count)
+        return self
+
+    def merge(self, other: "MissingnessProfile"):
+        """Merges the profile of another part of the data (same columns) into this one."""
+        if other.columns != self.columns:
+            raise ValueError("Profiles of different columns cannot be merged")
+        self.n_rows += other.n_rows
+        self.co_missing_counts += other.co_missing_counts
+        for key, count in other.pattern_counts.items():
+            self.pattern_counts[key] = self.pattern_counts.get(key, 0) + count
+        return self
+
+    @property
+    def null_counts(self) -> pd.Series:
+        return pd.Series(np.diag(self.co_missing_counts), index=self.columns, name="null_count")
+
+    @property
+    def null_rates(self) -> pd.Series:
+        return (self.null_counts / max(self.n_rows, 1)).rename("null_rate")
+
+    @property
+    def co_missing(self) -> pd.DataFrame:
+        """Number of rows in which both the row and the column variable are missing."""
+        return pd.DataFrame(self.co_missing_counts, index=self.columns, columns=self.columns)
+
+    def correlation(self) -> pd.DataFrame:
+        """Pearson (phi) correlation of the null indicators; NaN for never / always missing columns."""
+        n = self.n_rows
+        counts = self.co_missing_counts.astype("float64")
+        nulls = np.diag(counts)
+        spread = np.sqrt(nulls * (n - nulls))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = (n * counts - np.outer(nulls, nulls)) / np.outer(spread, spread)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def patterns(self, top: int = None) -> pd.DataFrame:
+        """
+        Missingness patterns by frequency: one boolean column per variable (True = missing), the
+        number of missing variables, and `count` / `share` of the rows with that pattern.
+        """
+        keys = list(self.pattern_counts)
+        if not keys:
+            # empty profile: no rows, no patterns
+            return pd.DataFrame(
+                {
+                    **{col: pd.Series(dtype=bool) for col in self.columns},
+                    "n_missing": pd.Series(dtype="int64"),
+                    "count": pd.Series(dtype="int64"),
+                    "share": pd.Series(dtype="float64"),
+                }
+            )
+        k = len(self.columns)
+        bits = np.unpackbits(
+            np.frombuffer(b"".join(keys), dtype="uint8").reshape(len(keys), -1), axis=1, count=k
+        ).astype(bool)
+        df = pd.DataFrame(bits, columns=self.columns)
+        df["n_missing"] = bits.sum(axis=1)
+        df["count"] = [self.pattern_counts[key] for key in keys]
+        df["share"] = df["count"] / max(self.n_rows, 1)
+        df = df.sort_values(["count", "n_missing"], ascending=[False, True], ignore_index=True)
+        return df if top is None else df.head(top)
+
+
+def null_mask(batch, columns: list) -> np.ndarray:
+    """Boolean (rows, k) null mask of a record batch; NaN counts as missing, as in `isna()`."""
+    mask = np.empty((batch.num_rows, len(columns)), dtype=bool)
+    for j, column in enumerate(columns):
+        values = batch.column(column)
+        nan_is_null = pa.types.is_floating(values.type)
+        mask[:, j] = pc.is_null(values, nan_is_null=nan_is_null).to_numpy(zero_copy_only=False)
+    return mask
+
+
+def profile_missingness(
+    path: str, columns: list = None, batch_size: int = 1 << 16
+) -> MissingnessProfile:
+    """
+    Profiles `columns` (all by default) of the parquet file at `path` in one streaming pass, one
+    column-projected batch in memory at a time. Missing values are counted as stored: the category
+    fallbacks of `schema` are not applied.
+    """
+    dataset = ds.dataset(path, format="parquet")
+    columns = list(columns) if columns is not None else dataset.schema.names
+    profile = MissingnessProfile(columns)
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        profile.update(null_mask(batch, columns))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Missingness profile of a parquet file")
+    parser.add_argument("path")
+    parser.add_argument("--columns", nargs="*", default=None)
+    parser.add_argument("--patterns", type=int, default=10, help="number of patterns to print")
+    args = parser.parse_args()
+
+    profile = profile_missingness(args.path, args.columns)
+    print(f"{profile.n_rows} rows, {len(profile.pattern_counts)} missingness patterns\n")
+    print(pd.concat([profile.null_counts, profile.null_rates.round(4)], axis=1).to_string())
+    print()
+    print(profile.co_missing.to_string())
+    print()
+    patterns = profile.patterns(args.patterns)
+    print(
+        patterns.assign(**{c: patterns[c].map({True: "x", False: ""}) for c in profile.columns})
+        .round(4)
+        .to_string(index=False)
+    )
+
+
+if __name__ == "__main__":
+    main()
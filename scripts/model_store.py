@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from arrow_store import ARROW_DIR, read_listings_mapped
+from data_access import MODEL_COLUMNS, file_digest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/"
+STORE_DIR = ROOT_DIR + "data/intermediaries/models/"
+
+# bump whenever the artifact layout (or the model frame) changes so that stale artifacts are refit
+ARTIFACT_VERSION = 4
+
+FORMULA = "np.log(price) ~ object_type + private_offer + rooms * square_meters"
+DATASETS = {
+    "rentals": ROOT_DIR + "data/intermediaries/rentals_leverage_removed.parquet",
+    "sales": ROOT_DIR + "data/intermediaries/sales_leverage_removed.parquet",
+}
+
+catcols = ["object_type", "rooms", "zip_code"]
+# categorical predictors: their unused levels are dropped before fitting
+FACTORS = ["object_type", "rooms"]
+
+
+class StoredModel:
+    """
+    Fitted OLS or random-intercept model restored from (or about to be written to) the model store.
+    Mirrors the parts of the statsmodels results API that the scripts use:
+    `params`, `fe_params`, `bse`, `random_effects`, `predict()` and `summary()`.
+    """
+
+    def __init__(
+        self,
+        formula: str,
+        kind: str,
+        params: pd.Series,
+        bse: pd.Series,
+        tvalues: pd.Series,
+        pvalues: pd.Series,
+        levels: dict,
+        scale: float,
+        nobs: int,
+        ranef: pd.Series = None,
+        ranef_err: pd.Series = None,
+        cov_re: float = None,
+    ):
+        self.formula = formula
+        self.kind = kind
+        self.params = params
+        self.bse = bse
+        self.tvalues = tvalues
+        self.pvalues = pvalues
+        self.levels = levels
+        self.scale = scale
+        self.nobs = nobs
+        self.ranef = ranef
+        self.ranef_err = ranef_err
+        self.cov_re = cov_re
+
+    @property
+    def fe_params(self) -> pd.Series:
+        return self.params
+
+    @property
+    def random_effects(self) -> dict:
+        """Random intercepts in the statsmodels layout: {group: Series(["Group"])}."""
+        if self.ranef is None:
+            return {}
+        return {group: pd.Series({"Group": value}) for group, value in self.ranef.items()}
+
+    def design_matrix(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Builds the fixed-effects design matrix for `df` with the columns of the fitted model.
+        Categorical columns are cast to the levels seen during fitting, so a single-row frame gets the
+        same dummy coding as the training data.
+        """
+        import patsy
+
+        df = df.assign(
+            **{
+                col: pd.Categorical(df[col], categories=levels)
+                for col, levels in self.levels.items()
+                if col in df.columns
+            }
+        )
+        rhs = self.formula.split("~", 1)[1]
+        X = patsy.dmatrix(rhs, df, return_type="dataframe", NA_action="raise")
+        return X.reindex(columns=self.params.index, fill_value=0.0)
+
+    def predict(self, df: pd.DataFrame) -> pd.Series:
+        """Predicts the fixed-effects part of the response (like `MixedLMResults.predict`)."""
+        return self.design_matrix(df) @ self.params
+
+    def summary(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {"coef": self.params, "std": self.bse, "tstat": self.tvalues, "pval": self.pvalues}
+        )
+
+    @classmethod
+    def from_result(cls, result, formula: str, kind: str, data: pd.DataFrame):
+        """Extracts a StoredModel from a fitted statsmodels OLS / MixedLM result."""
+        params = result.fe_params if kind == "mixedlm" else result.params
+        names = params.index
+        levels = {
+            col: data[col].cat.categories.tolist()
+            for col in data.columns
+            if isinstance(data[col].dtype, pd.CategoricalDtype)
+        }
+        levels.update({col: [False, True] for col in data.columns if data[col].dtype == bool})
+        model = cls(
+            formula=formula,
+            kind=kind,
+            params=params.astype("float64"),
+            bse=result.bse.reindex(names).astype("float64"),
+            tvalues=result.tvalues.reindex(names).astype("float64"),
+            pvalues=result.pvalues.reindex(names).astype("float64"),
+            levels=levels,
+            scale=float(result.scale),
+            nobs=int(result.nobs),
+        )
+        if kind == "mixedlm":
+            groups = list(result.random_effects.keys())
+            model.ranef = pd.Series(
+                [float(result.random_effects[g].iloc[0]) for g in groups],
+                index=pd.Index(groups, dtype="str"),
+            )
+            model.ranef_err = pd.Series(
+                [float(np.sqrt(result.random_effects_cov[g].iloc[0, 0])) for g in groups],
+                index=model.ranef.index,
+            )
+            model.cov_re = float(result.cov_re.iloc[0, 0])
+        return model
+
+    def save(self, path: str):
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "formula": self.formula,
+            "kind": self.kind,
+            "levels": self.levels,
+            "scale": self.scale,
+            "nobs": self.nobs,
+            "cov_re": self.cov_re,
+        }
+        arrays = {
+            "meta": np.array(json.dumps(meta)),
+            "names": self.params.index.to_numpy(dtype="str"),
+            "params": self.params.to_numpy(),
+            "bse": self.bse.to_numpy(),
+            "tvalues": self.tvalues.to_numpy(),
+            "pvalues": self.pvalues.to_numpy(),
+        }
+        if self.ranef is not None:
+            arrays["ranef_groups"] = self.ranef.index.to_numpy(dtype="str")
+            arrays["ranef"] = self.ranef.to_numpy()
+            arrays["ranef_err"] = self.ranef_err.to_numpy()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # write to a temporary file first so that concurrent readers never see a partial artifact
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["meta"]))
+            names = pd.Index(npz["names"].tolist())
+            model = cls(
+                formula=meta["formula"],
+                kind=meta["kind"],
+                params=pd.Series(npz["params"], index=names),
+                bse=pd.Series(npz["bse"], index=names),
+                tvalues=pd.Series(npz["tvalues"], index=names),
+                pvalues=pd.Series(npz["pvalues"], index=names),
+                levels=meta["levels"],
+                scale=meta["scale"],
+                nobs=meta["nobs"],
+                cov_re=meta["cov_re"],
+            )
+            if "ranef" in npz:
+                groups = pd.Index(npz["ranef_groups"].tolist(), dtype="str")
+                model.ranef = pd.Series(npz["ranef"], index=groups)
+                model.ranef_err = pd.Series(npz["ranef_err"], index=groups)
+        return model
+
+
+def artifact_key(formula: str, data_path: str, kind: str, groups: str = None) -> str:
+    """
+    Hash identifying a fitted model: artifact version, model kind, formula, grouping column and
+    the content of the input parquet file.
+    """
+    digest = hashlib.sha256()
+    for part in (str(ARTIFACT_VERSION), kind, formula, str(groups), file_digest(data_path)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:20]
+
+
+def artifact_path(
+    formula: str, data_path: str, kind: str, groups: str = None, store_dir: str = STORE_DIR
+) -> str:
+    name = os.path.splitext(os.path.basename(data_path))[0]
+    return os.path.join(
+        store_dir, f"{name}_{kind}_{artifact_key(formula, data_path, kind, groups)}.npz"
+    )
+
+
+def read_model_frame(data_path: str, arrow_dir: str = ARROW_DIR) -> pd.DataFrame:
+    # memory-mapped Arrow copy of the listings (shared by all processes reading `data_path`);
+    # categorical columns come with the fixed schema dictionaries
+    df = read_listings_mapped(data_path, columns=MODEL_COLUMNS, arrow_dir=arrow_dir)
+    # levels without any listing (e.g. SHARED_APARTMENT among sales) give all-zero dummy columns
+    # and a singular mixedlm design; zip_code keeps the full dictionary (missing outside Berlin)
+    for col in FACTORS:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def fit_model(formula: str, df: pd.DataFrame, kind: str, groups: str = "zip_code"):
+    """
+    Fits `formula` on `df` with statsmodels. `kind` is "ols" or "mixedlm"; the mixedlm fit leaves
+    out the listings without a `groups` value (zip codes outside plz.geojson).
+    """
+    # statsmodels is only needed when an artifact has to be (re)fit
+    import statsmodels.formula.api as smf
+
+    if kind == "ols":
+        return smf.ols(formula, data=df).fit()
+    if kind == "mixedlm":
+        df = df.loc[df[groups].notna()]
+        return smf.mixedlm(formula, data=df, groups=df[groups]).fit()
+    raise ValueError(f"Unknown model kind: {kind}")
+
+
+def load_or_fit(
+    formula: str,
+    data_path: str,
+    kind: str = "ols",
+    groups: str = "zip_code",
+    store_dir: str = STORE_DIR,
+    refit: bool = False,
+) -> StoredModel:
+    """
+    Returns the stored model for (`formula`, `data_path`, `kind`) and only fits it if no artifact exists
+    for the current content of `data_path` (or if `refit` is set). `kind` is "ols", "mixedlm" or
+    "reml" (the random-intercept model of `random_intercept`, fit without statsmodels).
+    """
+    grouped = kind in ("mixedlm", "reml")
+    path = artifact_path(formula, data_path, kind, groups if grouped else None, store_dir)
+    if os.path.exists(path) and not refit:
+        return StoredModel.load(path)
+
+    df = read_model_frame(data_path)
+    if kind == "reml":
+        # direct random-intercept REML fit on sufficient statistics (same estimates as mixedlm)
+        from random_intercept import fit_random_intercept
+
+        model = fit_random_intercept(formula, df, groups)
+    else:
+        result = fit_model(formula, df, kind, groups)
+        model = StoredModel.from_result(result, formula, kind, df)
+    model.save(path)
+    return model
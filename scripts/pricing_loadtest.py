@@ -0,0 +1,104 @@
+"""
+Load test for pricing_server.py: fires single-listing requests from concurrent clients and reports
+latency percentiles, throughput and failed requests (HTTP errors and connection failures).
+
+    python pricing_loadtest.py --requests 5000 --concurrency 32
+    python pricing_loadtest.py --url http://127.0.0.1:8702/predict/sales
+
+The listings draw their object types, rooms and zip codes from the levels of the model served at
+`--url` (read from the model store, like the server does), so every request is one the server
+prices rather than rejects.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+LEVEL_COLUMNS = ["object_type", "rooms", "zip_code"]
+
+
+def served_levels(dataset: str) -> dict:
+    """Levels of the categorical fields accepted by the model served for `dataset`."""
+    from model_store import DATASETS, FORMULA, load_or_fit
+
+    model = load_or_fit(FORMULA, DATASETS[dataset], kind="mixedlm")
+    return {col: list(map(str, model.levels[col])) for col in LEVEL_COLUMNS}
+
+
+def random_listing(rng: random.Random, levels: dict) -> dict:
+    return {
+        "object_type": rng.choice(levels["object_type"]),
+        "private_offer": rng.random() < 0.2,
+        "rooms": rng.choice(levels["rooms"]),
+        "square_meters": round(rng.uniform(20, 200), 1),
+        "zip_code": rng.choice(levels["zip_code"]),
+    }
+
+
+def run_client(url: str, levels: dict, n: int, seed: int, latencies: list, errors: list):
+    rng = random.Random(seed)
+    for _ in range(n):
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(random_listing(rng, levels)).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            errors.append(f"HTTP {e.code}: {e.read().decode(errors='replace')}")
+            continue
+        except urllib.error.URLError as e:
+            errors.append(str(e.reason))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the local pricing endpoint")
+    parser.add_argument("--url", default="http://127.0.0.1:8702/predict/rentals")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    from model_store import DATASETS
+
+    dataset = args.url.rstrip("/").rpartition("/")[2]
+    if dataset not in DATASETS:
+        parser.error(f"--url must end in one of {', '.join(DATASETS)}")
+    levels = served_levels(dataset)
+
+    latencies, errors = [], []
+    per_client = args.requests // args.concurrency
+    clients = [
+        threading.Thread(
+            target=run_client, args=(args.url, levels, per_client, seed, latencies, errors)
+        )
+        for seed in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"requests:    {len(latencies_ms)} ({args.concurrency} concurrent clients)")
+    print(f"errors:      {len(errors)}" + (f" (first: {errors[0]})" if errors else ""))
+    if len(latencies_ms):
+        print(f"p50 latency: {np.percentile(latencies_ms, 50):.2f} ms")
+        print(f"p99 latency: {np.percentile(latencies_ms, 99):.2f} ms")
+    print(f"throughput:  {len(latencies_ms) / elapsed:,.0f} requests/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Local HTTP pricing endpoint for the hierarchical rentals / sales models.
+
+    python pricing_server.py --port 8702
+
+    POST /predict/rentals   {"object_type": "APARTMENT", "private_offer": false, "rooms": "3",
+                             "square_meters": 65, "zip_code": "13059"}
+    -> {"predictions": [458.95]}
+
+The body may also be a list of listings. Models are loaded once at startup (from the model store)
+and requests arriving together are scored in a single vectorized call. Every listing is type- and
+level-checked when its request arrives (400 on failure), so one bad request cannot fail the others
+of its batch.
+"""
+
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_store import DATASETS, FORMULA, load_or_fit
+from scoring import ListingScorer
+
+FIELDS = ["object_type", "private_offer", "rooms", "square_meters", "zip_code"]
+
+
+class MicroBatcher:
+    """
+    Collects listings submitted from concurrent request threads and scores them together.
+    A batch is flushed once it holds `max_batch` listings or `max_wait` seconds after its first request.
+    """
+
+    def __init__(self, scorer: ListingScorer, max_batch: int = 512, max_wait: float = 0.002):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, listings: list) -> Future:
+        future = Future()
+        self._queue.put((listings, future))
+        return future
+
+    def _collect(self) -> list:
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            listings = [listing for batch, _ in pending for listing in batch]
+            try:
+                prices = self._score(listings)
+            except Exception:
+                # score the requests one by one, so that only the failing ones get the error
+                for batch, future in pending:
+                    try:
+                        future.set_result(self._score(batch))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for batch, future in pending:
+                future.set_result(prices[start : start + len(batch)])
+                start += len(batch)
+
+    def _score(self, listings: list) -> list:
+        return self.scorer.score_batch(
+            {col: [listing[col] for listing in listings] for col in FIELDS}
+        ).tolist()
+
+
+def load_batchers(refit: bool = False, **batch_kwargs) -> dict:
+    """Loads (or fits once) the mixed models and wraps each in a MicroBatcher."""
+    return {
+        name: MicroBatcher(
+            ListingScorer.from_model(load_or_fit(FORMULA, path, kind="mixedlm", refit=refit)),
+            **batch_kwargs,
+        )
+        for name, path in DATASETS.items()
+    }
+
+
+def parse_listing(listing, scorer: ListingScorer) -> dict:
+    """Checks the fields of one listing against the types and fitted levels of `scorer`."""
+    if not isinstance(listing, dict):
+        raise ValueError("Listings must be JSON objects")
+    missing = [col for col in FIELDS if col not in listing]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+
+    square_meters = listing["square_meters"]
+    if isinstance(square_meters, bool) or not isinstance(square_meters, (int, float)):
+        raise ValueError(f"square_meters must be a number, got {square_meters!r}")
+    if not math.isfinite(square_meters):
+        raise ValueError(f"square_meters must be finite, got {square_meters!r}")
+    if not isinstance(listing["private_offer"], bool):
+        raise ValueError(f"private_offer must be true or false, got {listing['private_offer']!r}")
+    for col in ("object_type", "rooms", "zip_code"):
+        if not isinstance(listing[col], str):
+            raise ValueError(f"{col} must be a string, got {listing[col]!r}")
+
+    parsed = {col: listing[col] for col in FIELDS}
+    for col in scorer.encoder.categorical:
+        scorer.encoder.check_levels(col, str(parsed[col]))
+    return parsed
+
+
+def validate(body, scorer: ListingScorer) -> list:
+    listings = body if isinstance(body, list) else [body]
+    return [parse_listing(listing, scorer) for listing in listings]
+
+
+class PricingHandler(BaseHTTPRequestHandler):
+    batchers = {}
+
+    def do_POST(self):
+        prefix, _, name = self.path.rstrip("/").rpartition("/")
+        if prefix != "/predict" or name not in self.batchers:
+            return self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            listings = validate(body, self.batchers[name].scorer)
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+        try:
+            prices = self.batchers[name].submit(listings).result()
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, {"predictions": prices})
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # per-request logging to stderr costs more than scoring the listing
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8702)
+    parser.add_argument("--max-batch", type=int, default=512)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument(
+        "--refit", action="store_true", help="refit the models instead of loading them"
+    )
+    args = parser.parse_args()
+
+    PricingHandler.batchers = load_batchers(
+        refit=args.refit, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000
+    )
+    server = ThreadingHTTPServer((args.host, args.port), PricingHandler)
+    print(
+        f"Serving {', '.join(PricingHandler.batchers)} on http://{args.host}:{args.port}/predict/"
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Mergeable streaming quantile sketch (t-digest) for bounded-memory outlier cutoffs.
+
+The digest keeps about `delta / 2` weighted centroids. Clusters shrink towards the tails (arcsine
+scale function): a cluster around quantile q holds about 2 * pi * n * sqrt(q * (1 - q)) / delta
+values, which bounds the rank error at q. For the 0.999 square_meters cutoff on 30k listings
+that is a handful of listings with the default delta.
+"""
+
+import numpy as np
+
+from data_access import iter_batches
+
+
+class TDigest:
+    def __init__(self, delta: float = 1000):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values):
+        """Adds a chunk of values (NaNs are ignored)."""
+        values = np.asarray(values, dtype="float64").ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(
+            np.concatenate([self.means, values]),
+            np.concatenate([self.weights, np.ones(len(values))]),
+        )
+        return self
+
+    def merge(self, other: "TDigest"):
+        """Merges another digest (e.g. from a different worker or file) into this one."""
+        if len(other.weights):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(
+                np.concatenate([self.means, other.means]),
+                np.concatenate([self.weights, other.weights]),
+            )
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cum = np.cumsum(weights)
+        q = (cum - weights / 2) / cum[-1]
+        # centroids falling into the same unit interval of the scale function k(q) are merged
+        k = np.floor(self.delta / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.flatnonzero(np.r_[True, np.diff(k) != 0])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(weights * means, starts) / self.weights
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s) `q`. Uses the same linear interpolation as `np.quantile`, so while
+        every centroid is a single value the result is exact.
+        """
+        if not len(self.weights):
+            return np.full(np.shape(q), np.nan)[()]
+        n = self.count
+        centers = np.cumsum(self.weights) - self.weights / 2
+        x = np.r_[0.5, centers, n - 0.5]
+        y = np.r_[self.min, self.means, self.max]
+        return np.interp(np.asarray(q, dtype="float64") * (n - 1) + 0.5, x, y)[()]
+
+    def to_dict(self) -> dict:
+        return {
+            "delta": self.delta,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        digest = cls(d["delta"])
+        digest.means = np.asarray(d["means"], dtype="float64")
+        digest.weights = np.asarray(d["weights"], dtype="float64")
+        digest.min, digest.max = d["min"], d["max"]
+        return digest
+
+
+def sketch_column(path: str, column: str, fill_value: float = None, delta: float = 1000) -> TDigest:
+    """
+    Builds a digest of one parquet column in a single streaming pass (one batch in memory at a time).
+    Missing values are counted as `fill_value`, or skipped if it is None.
+    """
+    digest = TDigest(delta)
+    for batch in iter_batches(path, columns=[column]):
+        values = batch[column].astype("float64")
+        digest.update(values if fill_value is None else values.fillna(fill_value))
+    return digest
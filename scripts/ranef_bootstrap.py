@@ -0,0 +1,253 @@
+"""
+Bootstrap confidence intervals for the zip-code random intercepts of the hierarchical model.
+
+    python ranef_bootstrap.py rentals sales --replicates 1000 --workers 8
+
+Replicates run in a process pool. The design matrix, fitted values and zip code groups are built
+once and shared with the workers as memory-mapped files; every worker loads the stored model and
+refits `MixedLM` on arrays (no formula parsing), warm-started from the fitted variance
+components. Replicate i always draws from `SeedSequence(seed, spawn_key=(i,))`, so results do not
+depend on the number of workers or on how often a run was interrupted. Finished chunks of
+replicates are checkpointed to disk and skipped when the run is resumed (or extended to more
+replicates).
+
+Methods:
+    parametric  simulate y* = X beta + Z u + e* conditional on the fitted intercepts u, like
+                lme4's bootMer(use.u = TRUE), so every zip keeps its own effect (default)
+    cluster     resample zip codes with replacement (a zip drawn k times enters as k groups; its
+                replicate effect is the mean of their intercepts, NaN if it was not drawn)
+"""
+
+import argparse
+import glob
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from arrow_store import map_arrays, shared_arrays
+from model_store import (
+    DATASETS,
+    FORMULA,
+    ROOT_DIR,
+    STORE_DIR,
+    artifact_key,
+    load_or_fit,
+    read_model_frame,
+)
+from tracing import TRACER, init_worker
+
+CHECKPOINT_DIR = STORE_DIR + "bootstrap/"
+TABLE_PATH = ROOT_DIR + "data/intermediaries/ranef_by_zipcode_{}_bootstrap.parquet"
+METHODS = ["parametric", "cluster"]
+
+# per-process state set up once by `_init_worker`
+_STATE = {}
+
+
+def replicate_arrays(model, df: pd.DataFrame) -> dict:
+    """Design matrix, response, fitted values and group layout shared by all replicates."""
+    X = model.design_matrix(df).to_numpy(dtype="float64")
+    codes = pd.Index(model.ranef.index).get_indexer(df["zip_code"].astype(str))
+    order = np.argsort(codes, kind="stable")
+    bounds = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(model.ranef)))]
+    return {
+        "X": X,
+        "y": np.log(df["price"].to_numpy(dtype="float64")),
+        "fitted_fe": X @ model.fe_params.to_numpy(),
+        "fitted_re": model.ranef.to_numpy()[codes],
+        "codes": codes,
+        # rows of group g: rows[bounds[g]:bounds[g + 1]]
+        "rows": order,
+        "bounds": bounds,
+    }
+
+
+def _init_worker(
+    dataset: str, formula: str, method: str, seed: int, paths: dict, trace: dict = None
+):
+    init_worker(trace)
+    _STATE.update(
+        map_arrays(paths),
+        model=load_or_fit(formula, DATASETS[dataset], kind="mixedlm"),
+        method=method,
+        seed=seed,
+    )
+
+
+def blup(resid: np.ndarray, codes: np.ndarray, n_groups: int, cov_re: float, scale: float):
+    """Random-intercept BLUPs: cov_re * sum(resid_g) / (scale + n_g * cov_re)."""
+    sums = np.bincount(codes, weights=resid, minlength=n_groups)
+    counts = np.bincount(codes, minlength=n_groups)
+    return cov_re * sums / (scale + counts * cov_re)
+
+
+def _fit(y: np.ndarray, X: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    import statsmodels.api as sm
+    from statsmodels.regression.mixed_linear_model import MixedLMParams
+
+    model = _STATE["model"]
+    start = MixedLMParams.from_components(
+        fe_params=model.fe_params.to_numpy(), cov_re=np.array([[model.cov_re / model.scale]])
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result = sm.MixedLM(y, X, groups=codes).fit(start_params=start)
+    resid = y - X @ result.fe_params
+    return blup(resid, codes, n_groups, float(np.asarray(result.cov_re)[0, 0]), result.scale)
+
+
+def replicate(i: int) -> np.ndarray:
+    """Random intercepts (one per zip code of the fitted model) of bootstrap replicate `i`."""
+    s = _STATE
+    model = s["model"]
+    n_groups = len(model.ranef)
+    rng = np.random.default_rng(np.random.SeedSequence(s["seed"], spawn_key=(i,)))
+
+    if s["method"] == "parametric":
+        noise = rng.normal(0, np.sqrt(model.scale), len(s["y"]))
+        y = s["fitted_fe"] + s["fitted_re"] + noise
+        return _fit(y, s["X"], s["codes"], n_groups)
+
+    drawn = rng.integers(0, n_groups, n_groups)
+    sizes = s["bounds"][drawn + 1] - s["bounds"][drawn]
+    rows = np.concatenate([s["rows"][s["bounds"][g] : s["bounds"][g + 1]] for g in drawn])
+    effects = _fit(s["y"][rows], s["X"][rows], np.repeat(np.arange(n_groups), sizes), n_groups)
+
+    # average the copies of every drawn zip code
+    copies = np.bincount(drawn, minlength=n_groups)
+    with np.errstate(invalid="ignore"):
+        return np.bincount(drawn, weights=effects, minlength=n_groups) / np.where(
+            copies, copies, np.nan
+        )
+
+
+def run_chunk(indices: list, path: str) -> int:
+    """Runs the replicates `indices` and checkpoints them atomically to `path`."""
+    effects = np.stack([replicate(i) for i in indices])
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, indices=np.asarray(indices), effects=effects)
+    os.replace(tmp_path, path)
+    return len(indices)
+
+
+def checkpoint_dir(dataset: str, method: str, seed: int, formula: str = FORMULA) -> str:
+    """Checkpoints are tied to the fitted model (formula and data content), method and seed."""
+    key = artifact_key(formula, DATASETS[dataset], "mixedlm", "zip_code")
+    return os.path.join(CHECKPOINT_DIR, f"{dataset}_{method}_seed{seed}_{key}")
+
+
+def load_checkpoints(directory: str) -> dict:
+    """Replicate index -> effects of every checkpointed replicate in `directory`."""
+    done = {}
+    for path in sorted(glob.glob(os.path.join(directory, "chunk_*.npz"))):
+        with np.load(path) as npz:
+            done.update(zip(npz["indices"].tolist(), npz["effects"]))
+    return done
+
+
+def bootstrap_ranef(
+    dataset: str,
+    n_replicates: int = 1000,
+    method: str = "parametric",
+    seed: int = 0,
+    max_workers: int = None,
+    chunk_size: int = 10,
+    formula: str = FORMULA,
+) -> np.ndarray:
+    """
+    Runs (or resumes) `n_replicates` bootstrap replicates of the random intercepts of `dataset` and
+    returns them as an (n_replicates, n_zip_codes) array, zip codes in the order of `model.ranef`.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    directory = checkpoint_dir(dataset, method, seed, formula)
+    os.makedirs(directory, exist_ok=True)
+    # fit (or load) the model once here so that the workers only ever load it
+    model = load_or_fit(formula, DATASETS[dataset], kind="mixedlm")
+
+    done = load_checkpoints(directory)
+    missing = [i for i in range(n_replicates) if i not in done]
+    chunks = [missing[start : start + chunk_size] for start in range(0, len(missing), chunk_size)]
+    if chunks:
+        df = read_model_frame(DATASETS[dataset])
+        # the rows of the fit: listings with a zip code
+        arrays = replicate_arrays(model, df.loc[df["zip_code"].notna()])
+        with shared_arrays(arrays) as paths, ProcessPoolExecutor(
+            max_workers=max_workers or min(len(chunks), os.cpu_count()),
+            initializer=_init_worker,
+            initargs=(dataset, formula, method, seed, paths, TRACER.worker_config()),
+        ) as pool:
+            futures = [
+                pool.submit(
+                    run_chunk,
+                    chunk,
+                    os.path.join(directory, f"chunk_{chunk[0]:06d}_{chunk[-1]:06d}.npz"),
+                )
+                for chunk in chunks
+            ]
+            for future in futures:
+                future.result()
+        done = load_checkpoints(directory)
+
+    return np.stack([done[i] for i in range(n_replicates)])
+
+
+def bootstrap_table(model, effects: np.ndarray, alpha: float = 0.05) -> pd.DataFrame:
+    """
+    Per-zip summary of the replicates in the layout of the ranef_by_zipcode tables (log price
+    scale): `pointestimate` of the fitted model, bootstrap `err` (std. deviation), percentile
+    `lower` / `upper` bounds, `significant` (the interval excludes zero) and `n_replicates`.
+    """
+    with warnings.catch_warnings():
+        # zip codes never drawn by the cluster bootstrap have all-NaN columns
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = np.nanquantile(effects, [alpha / 2, 1 - alpha / 2], axis=0)
+        err = np.nanstd(effects, axis=0, ddof=1)
+    return pd.DataFrame(
+        {
+            "zip": model.ranef.index.astype(str),
+            "pointestimate": model.ranef.to_numpy(),
+            "err": err,
+            "lower": lower,
+            "upper": upper,
+            "significant": (lower > 0) | (upper < 0),
+            "n_replicates": (~np.isnan(effects)).sum(axis=0),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap CIs for the zip-code random intercepts")
+    parser.add_argument("datasets", nargs="*", help=f"any of {', '.join(DATASETS)} (default: all)")
+    parser.add_argument("--replicates", type=int, default=1000)
+    parser.add_argument("--method", default="parametric", help=" or ".join(METHODS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=10)
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.datasets) - set(DATASETS))
+    if unknown or args.method not in METHODS:
+        parser.error(f"unknown datasets {unknown} or method {args.method!r}")
+
+    for dataset in args.datasets or DATASETS:
+        start = time.perf_counter()
+        effects = bootstrap_ranef(
+            dataset, args.replicates, args.method, args.seed, args.workers, args.chunk_size
+        )
+        model = load_or_fit(FORMULA, DATASETS[dataset], kind="mixedlm")
+        table = bootstrap_table(model, effects, args.alpha)
+        table.to_parquet(TABLE_PATH.format(dataset), index=False)
+        print(
+            f"{dataset}: {len(effects)} replicates, {table['significant'].sum()} of {len(table)} "
+            f"zip codes significant, {time.perf_counter() - start:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from tracing import span
+
+
+def ranef_array(model_result, categories) -> np.ndarray:
+    """
+    Returns the random intercepts of a fitted mixed model as a dense array aligned with `categories`.
+    Groups without an estimated effect (e.g. zip codes unseen during fitting) get a zero intercept.
+    """
+    random_effects = getattr(model_result, "random_effects", None) or {}
+    return np.array(
+        [
+            float(random_effects[group].iloc[0]) if group in random_effects else 0.0
+            for group in categories
+        ],
+        dtype="float64",
+    )
+
+
+def gather_ranef(model_result, groups: pd.Series) -> np.ndarray:
+    """
+    Maps every row of the categorical `groups` column to its random intercept with a single gather.
+    Missing groups and groups without an estimated effect map to zero.
+    """
+    groups = groups if isinstance(groups.dtype, pd.CategoricalDtype) else groups.astype("category")
+    # last slot holds the default for NaN codes (-1 indexes the end of the array)
+    table = np.append(ranef_array(model_result, groups.cat.categories), 0.0)
+    return table[groups.cat.codes.to_numpy()]
+
+
+def predict_with_ranef(model_result, df: pd.DataFrame, group_col: str = "zip_code") -> pd.Series:
+    """
+    Predicts log(price) for `df` including the random intercept of each row's group.
+    Works for OLS results as well (no random effects -> fixed effects only).
+    The result shares the index of `df`, so it is safe to combine with columns of `df`.
+    """
+    fixed = np.asarray(model_result.predict(df), dtype="float64")
+    if getattr(model_result, "random_effects", None):
+        with span("ranef_mapping", rows=len(df)):
+            fixed = fixed + gather_ranef(model_result, df[group_col])
+    return pd.Series(fixed, index=df.index, name="pred")
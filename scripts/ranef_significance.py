@@ -0,0 +1,80 @@
+"""
+Vectorized significance of the random intercepts in ranef_by_zipcode_*.parquet.
+
+All columns are computed as array operations over the whole table in one pass:
+CI bounds for a configurable z, the `is_sig` mask, two-sided normal p-values and
+multiple-testing-adjusted flags (Holm or Benjamini-Hochberg).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from data_access import cached_parquet
+from model_store import file_digest
+
+
+def adjust_pvalues(pvals: np.ndarray, method: str = "fdr_bh") -> np.ndarray:
+    """Holm ("holm") or Benjamini-Hochberg ("fdr_bh") adjusted p-values; NaNs stay NaN."""
+    pvals = np.asarray(pvals, dtype="float64")
+    adjusted = np.full_like(pvals, np.nan)
+    valid = np.flatnonzero(~np.isnan(pvals))
+    m = len(valid)
+    if not m:
+        return adjusted
+
+    order = valid[np.argsort(pvals[valid], kind="stable")]
+    ranked = pvals[order]
+    if method == "holm":
+        ranked = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif method == "fdr_bh":
+        ranked = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"Unknown method: {method}")
+    adjusted[order] = np.minimum(ranked, 1.0)
+    return adjusted
+
+
+def ranef_significance(
+    df: pd.DataFrame, z: float = 1.96, alpha: float = 0.05, method: str = "fdr_bh"
+) -> pd.DataFrame:
+    """
+    Adds significance columns to a random-effects table with `pointestimate` and `err`:
+    `lower`/`upper` (pointestimate -/+ z * err), `significant` (the CI excludes zero, same rule as
+    the former row-wise `is_sig`), `pointestimate_sig` (NaN where not significant), `pval`,
+    `pval_adj` and `significant_adj` (adjusted p-value below `alpha`).
+    """
+    estimate = df["pointestimate"].to_numpy(dtype="float64")
+    err = df["err"].to_numpy(dtype="float64")
+    lower = estimate - z * err
+    upper = estimate + z * err
+    not_significant = ((estimate < 0) & (upper >= 0)) | ((estimate > 0) & (lower <= 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pval = 2 * ndtr(-np.abs(estimate / err))
+    pval_adj = adjust_pvalues(pval, method)
+
+    return df.assign(
+        lower=lower,
+        upper=upper,
+        significant=~not_significant,
+        pointestimate_sig=np.where(not_significant, np.nan, estimate),
+        pval=pval,
+        pval_adj=pval_adj,
+        significant_adj=pval_adj < alpha,
+    )
+
+
+def load_significance(
+    ranef_path: str, z: float = 1.96, alpha: float = 0.05, method: str = "fdr_bh"
+) -> pd.DataFrame:
+    """
+    Significance table for the random-effects parquet at `ranef_path`, cached next to it as
+    `<name>_significance.parquet` and recomputed when the source or the settings change.
+    """
+    cache_path = os.path.splitext(ranef_path)[0] + "_significance.parquet"
+    key = f"{file_digest(ranef_path)}:z={z}:alpha={alpha}:{method}"
+    return cached_parquet(
+        cache_path, key, lambda: ranef_significance(pd.read_parquet(ranef_path), z, alpha, method)
+    )
@@ -0,0 +1,321 @@
+"""
+Headless batch rendering of the report figures.
+
+    python render_figures.py                      # render stale figures in parallel
+    python render_figures.py compare_coefs.png --force
+    python render_figures.py --list
+
+Every figure is a task with explicit input files and the code modules it is drawn by. A figure is
+only re-rendered if the digest of its inputs, its code and the render settings differs from the one
+recorded in the manifest at its last successful render (or the png is missing). Stale tasks run in
+a process pool on the Agg backend; the road store they read is brought up to date in the parent
+before the pool starts.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+# before pyplot is imported (here and in every worker process)
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+import figures
+from coefficients import COEF_PATH, read_coefficients
+from data_access import read_below_quantile
+from model_store import DATASETS, FORMULA, ROOT_DIR, file_digest
+from road_cache import MANIFEST, STORE_DIR, ensure_road_store
+from tracing import TRACER, init_worker
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__)) + "/"
+PLOTS_DIR = ROOT_DIR + "documents/plots/"
+MANIFEST_PATH = ROOT_DIR + "data/intermediaries/render_manifest.json"
+
+DFRENT = ROOT_DIR + "data/dfrent.parquet"
+DFBUY = ROOT_DIR + "data/dfbuy.parquet"
+PLZ = ROOT_DIR + "data/plz.geojson"
+# rewritten whenever the road store is rebuilt from a changed shapefile
+ROADS = STORE_DIR + MANIFEST
+
+Task = namedtuple("Task", ["render", "inputs", "code", "font_size", "savefig"])
+
+DESCRIPTIVE_CODE = ("figures.py", "data_access.py", "schema.py")
+MODEL_CODE = (
+    "figures.py",
+    "arrow_store.py",
+    "data_access.py",
+    "model_store.py",
+    "ranef_predict.py",
+    "schema.py",
+    "scoring.py",
+)
+GEO_CODE = (
+    "figures.py",
+    "arrow_store.py",
+    "data_access.py",
+    "model_store.py",
+    "ranef_significance.py",
+    "road_cache.py",
+    "schema.py",
+    "zip_geometry.py",
+)
+
+
+def _listings(columns: list):
+    # same 99.9th percentile square_meters cut as plots.py
+    return [
+        read_below_quantile(path, "square_meters", 0.999, columns=columns)
+        for path in (DFRENT, DFBUY)
+    ]
+
+
+def _model(dataset: str, kind: str):
+    from model_store import load_or_fit, read_model_frame
+
+    return load_or_fit(FORMULA, DATASETS[dataset], kind=kind), read_model_frame(DATASETS[dataset])
+
+
+def _geodf():
+    import geopandas as gpd
+
+    return gpd.read_file(PLZ)
+
+
+def render_price_distribution():
+    return figures.price_distribution(*_listings(["price"]))
+
+
+def render_price_sqm_scatter():
+    return figures.price_sqm_scatter(*_listings(["price", "square_meters", "private_offer"]))
+
+
+def render_rooms_distribution():
+    return figures.rooms_distribution(*_listings(["rooms", "square_meters"]))
+
+
+def render_compare_coefs():
+    coefs = read_coefficients(["rentals_model2", "sales_model2"])
+    return figures.compare_coefs(
+        figures.coefficient_frame(coefs.query("model == 'rentals_model2'")),
+        figures.coefficient_frame(coefs.query("model == 'sales_model2'")),
+    )
+
+
+def render_assessment(name: str):
+    dataset, kind, title = figures.ASSESSMENTS[name]
+    fig, _ = figures.model_assessment(*_model(dataset, kind), title)
+    return fig
+
+
+def render_predplot():
+    return figures.predplot_rooms_objtype(*_model("rentals", "mixedlm"))
+
+
+def render_geoplot():
+    fig, _, _ = figures.geoplot_rentals_and_sales(_geodf())
+    return fig
+
+
+def render_dist_to_mitte():
+    from zip_geometry import load_zip_geometry
+
+    geodf = _geodf()
+    merged = [figures.merge_significance(type_, geodf) for type_ in ("rentals", "sales")]
+    return figures.dist_to_mitte(*merged, load_zip_geometry())
+
+
+TIGHT = {"bbox_inches": "tight"}
+
+TASKS = {
+    "price_distribution_rentbuy.png": Task(
+        render_price_distribution, (DFRENT, DFBUY), DESCRIPTIVE_CODE, 14, TIGHT
+    ),
+    "price_sqm_scatter.png": Task(
+        render_price_sqm_scatter, (DFRENT, DFBUY), DESCRIPTIVE_CODE, 14, {}
+    ),
+    "rooms_distribution_rentbuy.png": Task(
+        render_rooms_distribution, (DFRENT, DFBUY), DESCRIPTIVE_CODE, 14, {}
+    ),
+    "compare_coefs.png": Task(
+        render_compare_coefs,
+        (COEF_PATH,),
+        ("figures.py", "coefficients.py"),
+        14,
+        {},
+    ),
+    **{
+        f"assessment_{name}.png": Task(
+            (render_assessment, name), (DATASETS[dataset],), MODEL_CODE, 16, {}
+        )
+        for name, (dataset, _, _) in figures.ASSESSMENTS.items()
+    },
+    "predplot_rooms_objtype.png": Task(render_predplot, (DATASETS["rentals"],), MODEL_CODE, 16, {}),
+    "geoplot_rentals_and_sales.png": Task(
+        render_geoplot,
+        (PLZ, figures.RANEF_PATH.format("rentals"), figures.RANEF_PATH.format("sales"), ROADS),
+        GEO_CODE,
+        16,
+        TIGHT,
+    ),
+    "dist_to_mitte.png": Task(
+        render_dist_to_mitte,
+        (PLZ, figures.RANEF_PATH.format("rentals"), figures.RANEF_PATH.format("sales")),
+        GEO_CODE,
+        16,
+        TIGHT,
+    ),
+}
+
+
+def task_key(name: str, dpi: int) -> str:
+    """Digest of a task's input files, code modules and render settings."""
+    task = TASKS[name]
+    h = hashlib.sha256(f"{name}:dpi={dpi}:font_size={task.font_size}".encode())
+    for path in task.inputs:
+        h.update(file_digest(path).encode())
+    for module in task.code + ("render_figures.py",):
+        h.update(file_digest(SCRIPTS_DIR + module).encode())
+    return h.hexdigest()
+
+
+def _read_manifest(path: str = MANIFEST_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _ensure_roads(names: list) -> dict:
+    """
+    Builds (if stale) the road store in the parent, before any worker reads it. Returns a failed
+    result for each of `names` that needs the roads if the store cannot be built.
+    """
+    needs_roads = [name for name in names if ROADS in TASKS[name].inputs]
+    if not needs_roads:
+        return {}
+    start = time.perf_counter()
+    try:
+        ensure_road_store()
+        return {}
+    except Exception:
+        error = traceback.format_exc()
+    seconds = time.perf_counter() - start
+    return {
+        name: {"figure": name, "seconds": seconds, "error": error, "skipped": False}
+        for name in needs_roads
+    }
+
+
+def render_one(name: str, out_dir: str, dpi: int) -> dict:
+    """Renders one figure. Runs inside a worker process; failures are reported, not raised."""
+    task = TASKS[name]
+    render, *args = task.render if isinstance(task.render, tuple) else (task.render,)
+    start = time.perf_counter()
+    try:
+        with plt.rc_context(figures.style(task.font_size)):
+            fig = render(*args)
+            fig.savefig(os.path.join(out_dir, name), dpi=dpi, facecolor="w", **task.savefig)
+        plt.close("all")
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return {"figure": name, "seconds": time.perf_counter() - start, "error": error}
+
+
+def render_figures(
+    names=None,
+    out_dir: str = PLOTS_DIR,
+    dpi: int = 300,
+    max_workers: int = None,
+    force: bool = False,
+    manifest_path: str = MANIFEST_PATH,
+) -> list:
+    """
+    Renders the stale figures among `names` (all by default) in parallel and returns one result
+    dict per figure. Up-to-date figures are reported as skipped.
+    """
+    names = list(TASKS) if names is None else list(names)
+    failed = _ensure_roads(names)
+    names = [name for name in names if name not in failed]
+    manifest = _read_manifest(manifest_path)
+    keys = {name: task_key(name, dpi) for name in names}
+    outputs = {name: os.path.abspath(os.path.join(out_dir, name)) for name in names}
+    stale = [
+        name
+        for name in names
+        if force or manifest.get(outputs[name]) != keys[name] or not os.path.exists(outputs[name])
+    ]
+
+    results = list(failed.values()) + [
+        {"figure": name, "seconds": 0.0, "error": None, "skipped": True}
+        for name in names
+        if name not in stale
+    ]
+    if stale:
+        os.makedirs(out_dir, exist_ok=True)
+        if any(TASKS[name].code == MODEL_CODE for name in stale):
+            # fit (or load) the models once up front instead of once per figure in the workers
+            from fit_grid import fit_grid
+
+            fit_grid(formulas={"interaction": FORMULA}, max_workers=max_workers)
+        with ProcessPoolExecutor(
+            max_workers=max_workers or min(len(stale), os.cpu_count()),
+            initializer=init_worker,
+            initargs=(TRACER.worker_config(),),
+        ) as pool:
+            futures = [pool.submit(render_one, name, out_dir, dpi) for name in stale]
+            for future in futures:
+                result = {**future.result(), "skipped": False}
+                if result["error"] is None:
+                    manifest[outputs[result["figure"]]] = keys[result["figure"]]
+                results.append(result)
+
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the report figures headless")
+    parser.add_argument("figures", nargs="*", help="figures to render (default: all)")
+    parser.add_argument("--out-dir", default=PLOTS_DIR)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="re-render up-to-date figures")
+    parser.add_argument("--list", action="store_true", help="list the figure tasks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, task in TASKS.items():
+            print(name)
+            for path in task.inputs:
+                print(f"    {os.path.relpath(path, ROOT_DIR)}")
+        return
+
+    unknown = sorted(set(args.figures) - set(TASKS))
+    if unknown:
+        parser.error(f"unknown figures: {', '.join(unknown)} (see --list)")
+
+    start = time.perf_counter()
+    results = render_figures(args.figures or None, args.out_dir, args.dpi, args.workers, args.force)
+    for result in results:
+        status = "skipped" if result["skipped"] else "FAILED" if result["error"] else "rendered"
+        print(f"{result['figure']:>34}: {status:<8} {result['seconds']:6.2f}s")
+        if result["error"]:
+            print(result["error"], file=sys.stderr)
+    print(f"total wall time: {time.perf_counter() - start:.2f}s")
+    sys.exit(any(result["error"] for result in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Spatially indexed, class-partitioned cache of the OSM road layer used as geoplot background.
+
+    python road_cache.py [path/to/gis_osm_roads_free_1.shp]
+
+The shapefile is parsed once and split into one GeoParquet file per road class (`fclass`).
+Rows are Hilbert-sorted and written with a bbox covering column in small row groups, so a
+bbox read only decodes the row groups overlapping the map extent. Loaded layers are memoized
+per process.
+"""
+
+import functools
+import json
+import os
+import sys
+
+from model_store import ROOT_DIR
+
+ROADS_SHAPEFILE = ROOT_DIR + "../../brb_geo/gis_osm_roads_free_1.shp"
+STORE_DIR = ROOT_DIR + "data/intermediaries/roads/"
+MANIFEST = "manifest.json"
+
+# road classes drawn on the geoplots
+MAP_FCLASSES = ("motorway", "motorway_link", "primary", "secondary", "tertiary")
+
+
+def _source_signature(shapefile: str) -> list:
+    """Size and mtime of the shapefile components: cheap change detection for a large layer."""
+    base = os.path.splitext(shapefile)[0]
+    return [
+        [ext, os.path.getsize(base + ext), os.path.getmtime(base + ext)]
+        for ext in (".shp", ".dbf", ".shx")
+        if os.path.exists(base + ext)
+    ]
+
+
+def _read_manifest(store_dir: str) -> dict:
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_road_store(shapefile: str = ROADS_SHAPEFILE, store_dir: str = STORE_DIR) -> dict:
+    """
+    Splits the road shapefile into per-fclass GeoParquet files and writes a manifest. Files of
+    classes no longer in the shapefile are removed.
+    """
+    import geopandas as gpd
+
+    roads = gpd.read_file(shapefile, columns=["fclass"])
+    os.makedirs(store_dir, exist_ok=True)
+
+    fclasses = {}
+    for fclass, part in roads.groupby("fclass"):
+        part = part.iloc[part.geometry.hilbert_distance().argsort()]
+        part.to_parquet(
+            os.path.join(store_dir, f"{fclass}.parquet"),
+            index=False,
+            write_covering_bbox=True,
+            row_group_size=4096,
+        )
+        fclasses[fclass] = {"rows": len(part), "bbox": [float(v) for v in part.total_bounds]}
+
+    manifest = {
+        "source": os.path.abspath(shapefile),
+        "source_signature": _source_signature(shapefile),
+        "crs": roads.crs.to_string(),
+        "fclasses": fclasses,
+    }
+    with open(os.path.join(store_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    for name in os.listdir(store_dir):
+        stem, ext = os.path.splitext(name)
+        if ext == ".parquet" and stem not in fclasses:
+            os.remove(os.path.join(store_dir, name))
+    return manifest
+
+
+def ensure_road_store(shapefile: str = ROADS_SHAPEFILE, store_dir: str = STORE_DIR) -> dict:
+    """Returns the manifest of the store, (re)building it if the shapefile changed."""
+    manifest = _read_manifest(store_dir)
+    if not manifest or (
+        os.path.exists(shapefile) and manifest["source_signature"] != _source_signature(shapefile)
+    ):
+        manifest = build_road_store(shapefile, store_dir)
+    return manifest
+
+
+def _overlaps(a, b) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+@functools.lru_cache(maxsize=None)
+def load_roads(
+    fclasses: tuple = MAP_FCLASSES,
+    bbox: tuple = None,
+    shapefile: str = ROADS_SHAPEFILE,
+    store_dir: str = STORE_DIR,
+):
+    """
+    Roads of the given classes intersecting `bbox` (minx, miny, maxx, maxy), read from the store.
+    Memoized: repeated calls with the same arguments (e.g. one per geoplot panel) are free.
+    Treat the returned GeoDataFrame as read-only.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    manifest = ensure_road_store(shapefile, store_dir)
+    parts = [
+        gpd.read_parquet(os.path.join(store_dir, f"{fclass}.parquet"), bbox=bbox)
+        for fclass in fclasses
+        if fclass in manifest["fclasses"]
+        and (bbox is None or _overlaps(manifest["fclasses"][fclass]["bbox"], bbox))
+    ]
+    if not parts:
+        return gpd.GeoDataFrame({"fclass": []}, geometry=[], crs=manifest["crs"])
+    return gpd.GeoDataFrame(pd.concat(parts, ignore_index=True), crs=manifest["crs"])
+
+
+if __name__ == "__main__":
+    manifest = build_road_store(*sys.argv[1:2])
+    for fclass, info in sorted(manifest["fclasses"].items()):
+        print(f"{fclass:>20}: {info['rows']:>8} rows")
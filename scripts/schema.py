@@ -0,0 +1,89 @@
+"""
+Fixed category dictionaries of the listing columns, applied when the parquet files are read.
+
+Every frame (rentals, sales, model frames, batches) gets the same categories in the same order, so a
+code means the same zip code / room value everywhere and per-zip arrays aligned with
+`berlin_zip_codes()` can be indexed with the codes directly. The orders of `object_type` and `rooms`
+are those of the R factors written by data_cleaning_script.R, so the dummy coding (reference levels)
+is unchanged. The zip codes are those of the areas in plz.geojson. Codes are int8 for object_type /
+rooms and int16 for zip_code.
+"""
+
+import functools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+OBJECT_TYPES = [
+    "APARTMENT",
+    "HOUSE",
+    "SHARED_APARTMENT",
+    "TEMPORARY_LIVING",
+    "HOLIDAY_HOUSE_APARTMENT",
+]
+ROOMS = ["1", "2", "3", "4", "5", "Shared", "Missing"]
+
+# resolved here, as model_store (which defines ROOT_DIR) imports this module
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/"
+GEOJSON_PATH = ROOT_DIR + "data/plz.geojson"
+
+
+@functools.lru_cache(maxsize=None)
+def berlin_zip_codes(geojson_path: str = GEOJSON_PATH) -> tuple:
+    """Sorted zip codes of the areas of plz.geojson (read once per process)."""
+    with open(geojson_path) as f:
+        features = json.load(f)["features"]
+    return tuple(sorted({str(feature["properties"]["plz"]) for feature in features}))
+
+
+def categories() -> dict:
+    """The fixed dictionary of every categorical listing column."""
+    return {
+        "object_type": OBJECT_TYPES,
+        "rooms": ROOMS,
+        "zip_code": list(berlin_zip_codes()),
+    }
+
+
+# values outside the dictionary are missing values in these columns and an error in the others:
+# scraped zip codes outside Berlin or malformed ("00000", "1079") are left out of the zip-level
+# analyses (the random-intercept fits, the maps)
+OPTIONAL = ("zip_code",)
+
+
+def encode(values, column: str) -> pd.Categorical:
+    """
+    Encodes `values` (strings or a categorical with any categories) with the fixed dictionary of
+    `column`. Categorical input is recoded through its categories only, not row by row.
+    Values outside the dictionary raise a ValueError, or become missing for the `OPTIONAL` columns.
+    """
+    dictionary = pd.Index(categories()[column])
+
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        mapping = dictionary.get_indexer(values.cat.categories.astype(str))
+        source = values.cat.codes.to_numpy()
+        # code -1 (missing) stays -1
+        codes = np.append(mapping, -1)[source]
+        unknown = values.cat.categories[np.unique(source[(codes < 0) & (source >= 0)])]
+    else:
+        present = values.notna().to_numpy()
+        strings = values.astype(str)
+        codes = dictionary.get_indexer(strings.where(present, None))
+        unknown = strings[present & (codes < 0)].unique()
+    if len(unknown) and column not in OPTIONAL:
+        raise ValueError(
+            f"Unknown {column} values {sorted(map(str, unknown))}, "
+            f"expected one of {', '.join(dictionary)}"
+        )
+    return pd.Categorical.from_codes(codes, categories=dictionary)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Encodes the categorical listing columns present in `df` in place and returns it."""
+    for column in categories():
+        if column in df.columns:
+            df[column] = encode(df[column], column)
+    return df
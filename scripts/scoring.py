@@ -0,0 +1,180 @@
+import json
+import re
+
+import numpy as np
+
+_LEVEL_RE = re.compile(r"^(?P<col>[^\[]+)\[T\.(?P<level>.*)\]$")
+
+
+def parse_term(name: str) -> tuple:
+    """
+    Parses a patsy column name into its factors, e.g.
+    "rooms[T.2]:square_meters" -> (("rooms", "2"), ("square_meters", None)) and "Intercept" -> ().
+    Categorical factors carry their level, numeric factors carry None.
+    """
+    if name == "Intercept":
+        return ()
+    factors = []
+    for factor in name.split(":"):
+        match = _LEVEL_RE.match(factor)
+        factors.append((match["col"], match["level"]) if match else (factor, None))
+    return tuple(factors)
+
+
+class DesignEncoder:
+    """
+    Fixed design-vector encoder compiled from the column names of a fitted formula.
+    Covers treatment-coded categoricals (incl. booleans), numeric columns and their interactions, e.g.
+    `object_type + private_offer + rooms * square_meters`, without patsy or pandas.
+    Categorical values are matched by their string representation ("3", "True", "APARTMENT")
+    against `levels` (column -> fitted levels, reference level included); other values raise a
+    ValueError instead of silently encoding like the reference level.
+    """
+
+    def __init__(self, names, levels: dict):
+        self.names = list(names)
+        self.terms = [parse_term(name) for name in self.names]
+        self.categorical = sorted({col for t in self.terms for col, lvl in t if lvl is not None})
+        self.numeric = sorted({col for t in self.terms for col, lvl in t if lvl is None})
+        self.columns = self.categorical + self.numeric
+        self.levels = {col: [str(level) for level in levels[col]] for col in self.categorical}
+
+    def check_levels(self, col: str, values):
+        """Raises a ValueError naming the first of `values` (strings) that is no fitted level."""
+        unknown = ~np.isin(values, self.levels[col])
+        if np.any(unknown):
+            value = str(np.asarray(values)[unknown].flat[0])
+            raise ValueError(
+                f"Unknown {col} level {value!r}, expected one of {', '.join(self.levels[col])}"
+            )
+
+    def encode(self, listing: dict) -> np.ndarray:
+        """Encodes a single listing (a mapping of column -> value) into a design vector."""
+        values = {col: str(listing[col]) for col in self.categorical}
+        for col in self.categorical:
+            self.check_levels(col, values[col])
+        values.update({col: float(listing[col]) for col in self.numeric})
+        x = np.empty(len(self.terms))
+        for i, factors in enumerate(self.terms):
+            v = 1.0
+            for col, level in factors:
+                if level is None:
+                    v *= values[col]
+                elif values[col] != level:
+                    v = 0.0
+                    break
+            x[i] = v
+        return x
+
+    def encode_batch(self, columns: dict) -> np.ndarray:
+        """Encodes a batch given as a mapping of column -> sequence of values into an n x p matrix."""
+        values = {col: np.asarray(columns[col]).astype(str) for col in self.categorical}
+        for col in self.categorical:
+            self.check_levels(col, values[col])
+        values.update({col: np.asarray(columns[col], dtype="float64") for col in self.numeric})
+        n = len(next(iter(values.values()))) if values else 0
+        X = np.ones((n, len(self.terms)))
+        for i, factors in enumerate(self.terms):
+            for col, level in factors:
+                X[:, i] *= values[col] if level is None else values[col] == level
+        return X
+
+
+def fitted_levels(model) -> dict:
+    """Column -> levels of the categorical columns a StoredModel or statsmodels result was fit on."""
+    if hasattr(model, "levels"):
+        return model.levels
+    data = model.model.data
+    spec = getattr(data, "model_spec", None) or data.design_info
+    return {
+        factor.name(): list(info.categories)
+        for factor, info in spec.factor_infos.items()
+        if info.type == "categorical"
+    }
+
+
+class ListingScorer:
+    """
+    Scores listings with a fitted log(price) model using only NumPy arrays:
+    coefficient vector, compiled design encoder and sorted zip-code -> random intercept table.
+    Works with StoredModel artifacts as well as statsmodels OLS / MixedLM results.
+    """
+
+    def __init__(
+        self, names, coef, levels: dict, groups=(), intercepts=(), group_col: str = "zip_code"
+    ):
+        self.encoder = DesignEncoder(names, levels)
+        self.coef = np.asarray(coef, dtype="float64")
+        self.group_col = group_col
+
+        groups = np.asarray(groups, dtype="str")
+        order = np.argsort(groups)
+        self.groups = groups[order]
+        # trailing zero is the intercept of unseen zip codes
+        self.intercepts = np.append(np.asarray(intercepts, dtype="float64")[order], 0.0)
+        self._group_index = {g: i for i, g in enumerate(self.groups)}
+
+    @classmethod
+    def from_model(cls, model, group_col: str = "zip_code"):
+        params = model.fe_params if hasattr(model, "fe_params") else model.params
+        random_effects = getattr(model, "random_effects", None) or {}
+        return cls(
+            params.index,
+            params.to_numpy(),
+            fitted_levels(model),
+            groups=list(random_effects.keys()),
+            intercepts=[float(v.iloc[0]) for v in random_effects.values()],
+            group_col=group_col,
+        )
+
+    def save(self, path: str, **metadata):
+        """Writes the scorer arrays (and string `metadata`) to an .npz file."""
+        np.savez(
+            path,
+            names=np.asarray(self.encoder.names, dtype="str"),
+            coef=self.coef,
+            levels=np.array(json.dumps(self.encoder.levels)),
+            groups=self.groups,
+            intercepts=self.intercepts[:-1],
+            group_col=np.array(self.group_col),
+            **{key: np.array(value) for key, value in metadata.items()},
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(
+                npz["names"].tolist(),
+                npz["coef"],
+                json.loads(str(npz["levels"])),
+                groups=npz["groups"],
+                intercepts=npz["intercepts"],
+                group_col=str(npz["group_col"]),
+            )
+
+    def group_positions(self, groups) -> np.ndarray:
+        """Vectorized lookup of zip codes in the intercept table (unseen -> default slot)."""
+        groups = np.asarray(groups).astype(str)
+        if not len(self.groups):
+            return np.zeros(len(groups), dtype="intp")
+        pos = np.searchsorted(self.groups, groups)
+        pos = np.minimum(pos, len(self.groups) - 1)
+        return np.where(self.groups[pos] == groups, pos, len(self.groups))
+
+    def log_price(self, listing: dict) -> float:
+        group = self._group_index.get(str(listing.get(self.group_col)), len(self.groups))
+        return float(self.encoder.encode(listing) @ self.coef + self.intercepts[group])
+
+    def score(self, listing: dict) -> float:
+        """Predicted price (EUR) of a single listing."""
+        return float(np.exp(self.log_price(listing)))
+
+    def log_price_batch(self, columns: dict) -> np.ndarray:
+        eta = self.encoder.encode_batch(columns) @ self.coef
+        if self.group_col in columns:
+            eta += self.intercepts[self.group_positions(columns[self.group_col])]
+        return eta
+
+    def score_batch(self, columns: dict) -> np.ndarray:
+        """Predicted prices (EUR) for a batch given as a mapping of column -> sequence of values."""
+        return np.exp(self.log_price_batch(columns))
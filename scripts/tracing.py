@@ -0,0 +1,312 @@
+"""
+Named spans for stage-level profiling of the analysis scripts.
+
+    from tracing import TRACER, span
+
+    TRACER.enable()
+    with span("fit_grid"):
+        ...
+    with span("read_model_frame") as s:
+        df = ...
+        s.rows = len(df)
+    TRACER.report("prediction_plots")     # summary table + Chrome trace JSON
+
+Every span records wall time, CPU time of its process, CPU time of the child processes that
+finished while it was open (e.g. the workers of a pool shut down inside it), the peak resident set
+of its process while it was open and an optional row count. Spans nest: the peak of an inner span
+also counts for the enclosing ones. Spans are no-ops until the tracer is enabled, so library code
+can be instrumented permanently.
+
+Process pools record their workers' spans into the same trace when they are started with
+`initializer=init_worker, initargs=(TRACER.worker_config(),)`: workers append their events to a
+spool directory, `summary` and `report` merge them (each keeps the pid of its worker).
+
+Opt-in captures, per span name (comma-separated, or "all"), through the environment:
+    TRACE_PROFILE=fit_grid,geoplot       cProfile of every such span, written by `report` to
+                                         <trace dir>/<name>.<pid>.<n>.prof (n-th span of that name)
+    TRACE_TRACEMALLOC=all                peak of the Python / NumPy heap traced by tracemalloc
+
+The trace (`<trace dir>/<name>.json`) opens in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import contextlib
+import cProfile
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# not from model_store: the data access layer imports this module
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/"
+TRACE_DIR = ROOT_DIR + "data/intermediaries/traces/"
+
+
+def _names(value) -> set:
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+def _rss_kb(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def _children_cpu() -> float:
+    """User + system time of the terminated and waited-for child processes."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Span:
+    def __init__(self, name: str, rows: int = None, args: dict = None):
+        self.name = name
+        self.rows = rows
+        self.args = dict(args or {})
+        self.peak_rss_kb = 0
+        self.peak_traced = 0
+
+
+class Tracer:
+    def __init__(self, profile=(), tracemalloc_spans=()):
+        self.enabled = False
+        self.profile = set(profile)
+        self.tracemalloc_spans = set(tracemalloc_spans)
+        self.events = []
+        self.trace_dir = TRACE_DIR
+        self._stack = []
+        self._profiling = False
+        self._sequence = {}
+        self._origin = time.perf_counter()
+        self._epoch = time.time()
+        # worker events and cProfile dumps until `report`; set when enabled
+        self._spool = None
+        self._worker = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            profile=_names(os.environ.get("TRACE_PROFILE")),
+            tracemalloc_spans=_names(os.environ.get("TRACE_TRACEMALLOC")),
+        )
+
+    def enable(self, reset: bool = True, trace_dir: str = None):
+        self.enabled = True
+        if trace_dir is not None:
+            self.trace_dir = trace_dir
+        if reset or self._spool is None:
+            self.events = []
+            self._origin = time.perf_counter()
+            self._epoch = time.time()
+            self._spool = tempfile.mkdtemp(prefix="trace-")
+        return self
+
+    def worker_config(self):
+        """`init_worker` argument that makes pool workers record into this trace (None if disabled)."""
+        if not self.enabled:
+            return None
+        return {
+            "spool": self._spool,
+            "epoch": self._epoch,
+            "profile": sorted(self.profile),
+            "tracemalloc": sorted(self.tracemalloc_spans),
+        }
+
+    def enable_worker(self, config: dict):
+        """Records the spans of this (worker) process into the spool of the parent's trace."""
+        self.enabled = True
+        self.profile = set(config["profile"])
+        self.tracemalloc_spans = set(config["tracemalloc"])
+        # forked workers inherit the parent's events and open spans
+        self.events, self._stack, self._profiling = [], [], False
+        self._spool = config["spool"]
+        self._worker = True
+        # timestamps relative to the start of the parent's trace
+        self._origin = time.perf_counter() - (time.time() - config["epoch"])
+
+    def _wants(self, names: set, name: str) -> bool:
+        return "all" in names or name in names
+
+    def _checkpoint(self):
+        """Folds the peaks since the last span boundary into every open span and resets them."""
+        peak = _rss_kb("VmHWM")
+        traced = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        for open_span in self._stack:
+            open_span.peak_rss_kb = max(open_span.peak_rss_kb, peak or 0)
+            open_span.peak_traced = max(open_span.peak_traced, traced)
+        try:
+            # resets the high-water mark of the resident set (Linux)
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def span(self, name: str, rows: int = None, **args):
+        """Records the enclosed block as span `name`; set `.rows` on the yielded span if needed."""
+        current = Span(name, rows, args)
+        if not self.enabled:
+            yield current
+            return
+
+        profiler = None
+        if self._wants(self.profile, name) and not self._profiling:
+            # cProfile cannot nest: inner spans of a profiled span are part of its profile
+            profiler, self._profiling = cProfile.Profile(), True
+        started_tracemalloc = False
+        if self._wants(self.tracemalloc_spans, name) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+
+        self._checkpoint()
+        self._stack.append(current)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        start_children = _children_cpu()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield current
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            children_cpu = _children_cpu() - start_children
+            self._checkpoint()
+            self._stack.pop()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak_rss_kb = max(parent.peak_rss_kb, current.peak_rss_kb)
+                parent.peak_traced = max(parent.peak_traced, current.peak_traced)
+
+            args = {**current.args, "cpu_ms": round(cpu * 1000, 3)}
+            if children_cpu:
+                args["children_cpu_ms"] = round(children_cpu * 1000, 3)
+            if current.peak_rss_kb:
+                args["peak_rss_mb"] = round(current.peak_rss_kb / 1024, 1)
+            if current.rows is not None:
+                args["rows"] = int(current.rows)
+            if started_tracemalloc or tracemalloc.is_tracing():
+                args["peak_traced_mb"] = round(current.peak_traced / 2**20, 1)
+            if started_tracemalloc:
+                tracemalloc.stop()
+            if profiler is not None:
+                self._profiling = False
+                self._sequence[name] = self._sequence.get(name, 0) + 1
+                # moved to the trace directory by `report`
+                args["profile"] = os.path.join(
+                    self._spool, f"{name}.{os.getpid()}.{self._sequence[name]}.prof"
+                )
+                profiler.dump_stats(args["profile"])
+
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": round((start_wall - self._origin) * 1e6, 1),
+                "dur": round(wall * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            if self._worker:
+                # one file per worker process, so appends never interleave
+                with open(os.path.join(self._spool, f"events.{os.getpid()}.jsonl"), "a") as f:
+                    f.write(json.dumps(event) + "\n")
+            else:
+                self.events.append(event)
+
+    def _merge_workers(self):
+        """Moves the events spooled by pool workers into `events`."""
+        if self._spool is None:
+            return
+        for path in sorted(glob.glob(os.path.join(self._spool, "events.*.jsonl"))):
+            with open(path) as f:
+                self.events += [json.loads(line) for line in f if line.strip()]
+            os.remove(path)
+
+    def _move_profiles(self, trace_dir: str):
+        for event in self.events:
+            profile = event["args"].get("profile")
+            if profile and os.path.dirname(profile) == self._spool and os.path.exists(profile):
+                os.makedirs(trace_dir, exist_ok=True)
+                event["args"]["profile"] = shutil.move(
+                    profile, os.path.join(trace_dir, os.path.basename(profile))
+                )
+
+    def summary(self):
+        """Spans aggregated by name in order of first occurrence: calls, wall / CPU time, peak, rows."""
+        import pandas as pd
+
+        self._merge_workers()
+        if not self.events:
+            return pd.DataFrame()
+        # events are recorded when a span closes (inner spans first), ordered by start here
+        events = sorted(self.events, key=lambda e: e["ts"])
+        df = pd.DataFrame(
+            {
+                "span": [e["name"] for e in events],
+                "wall_s": [e["dur"] / 1e6 for e in events],
+                "cpu_s": [e["args"]["cpu_ms"] / 1000 for e in events],
+                "children_cpu_s": [e["args"].get("children_cpu_ms", 0) / 1000 for e in events],
+                "peak_rss_mb": [e["args"].get("peak_rss_mb") for e in events],
+                "rows": [e["args"].get("rows") for e in events],
+            }
+        )
+        return (
+            df.groupby("span", sort=False)
+            .agg(
+                calls=("wall_s", "size"),
+                wall_s=("wall_s", "sum"),
+                cpu_s=("cpu_s", "sum"),
+                children_cpu_s=("children_cpu_s", "sum"),
+                peak_rss_mb=("peak_rss_mb", "max"),
+                rows=("rows", lambda rows: rows.sum(min_count=1)),
+            )
+            .astype({"rows": "Int64"})
+        )
+
+    def write_chrome_trace(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def report(self, name: str, trace_dir: str = None):
+        """
+        Prints the summary table and writes the Chrome trace (worker spans included) and the
+        cProfile dumps to `trace_dir` (that of `enable`, by default `TRACE_DIR`).
+        """
+        if not self.enabled:
+            return None
+        trace_dir = trace_dir or self.trace_dir
+        print(self.summary().round(3).to_string())
+        self._move_profiles(trace_dir)
+        path = self.write_chrome_trace(os.path.join(trace_dir, f"{name}.json"))
+        print(f"trace: {path}")
+        return path
+
+
+TRACER = Tracer.from_env()
+span = TRACER.span
+
+
+def init_worker(config: dict = None):
+    """Process pool initializer: records the worker's spans into the trace of `config`."""
+    if config is not None:
+        TRACER.enable_worker(config)
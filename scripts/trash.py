@@ -7,8 +7,9 @@ import matplotlib.pyplot as plt
 # fig, ax = plt.subplots(1, 1, figsize=(20, 20))
 # df.plot(ax=ax, color="black")
 
+from road_cache import load_roads
+
 #%%
-df = gpd.read_file("../../../brb_geo/gis_osm_roads_free_1.shp")
 
 #%%
 fclasses = [
@@ -43,4 +44,4 @@ fclasses = [
 
 
 fig, ax = plt.subplots(1, 1, figsize=(20, 20))
-df.query("fclass.isin(@fclasses)").plot(color="black", ax=ax)
+load_roads(tuple(fclasses)).plot(color="black", ax=ax)
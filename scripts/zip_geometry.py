@@ -0,0 +1,70 @@
+"""
+Precomputed zip-code geometry table (projected centroids and distance to Mitte).
+
+Built once from plz.geojson and stored as parquet next to the other intermediaries. The table is
+rebuilt automatically when plz.geojson changes (its digest is stored in the parquet metadata), so
+geo consumers only pay for a small parquet read instead of parsing and reprojecting the GeoJSON.
+"""
+
+import numpy as np
+import pandas as pd
+
+from data_access import cached_parquet
+from model_store import ROOT_DIR, file_digest
+
+GEOJSON_PATH = ROOT_DIR + "data/plz.geojson"
+TABLE_PATH = ROOT_DIR + "data/intermediaries/zip_geometry.parquet"
+
+MITTE_ZIP = "10117"
+# projected CRS of the published dist_to_mitte plot
+PROJECTED_EPSG = 32642
+
+
+def build_zip_geometry(geojson_path: str = GEOJSON_PATH) -> pd.DataFrame:
+    """
+    One row per zip code (multi-part zip areas are dissolved) with its centroid in EPSG:4326 and
+    in the projected CRS, the distance (km) from the Mitte centroid to the zip area (0 for areas
+    containing it, as computed by `sjoin_nearest`) and the centroid-to-centroid distance (km).
+    """
+    import geopandas as gpd
+
+    geodf = gpd.read_file(geojson_path).dissolve(by="plz", as_index=False)
+    projected = geodf.to_crs(epsg=PROJECTED_EPSG)
+    centroids = projected.centroid
+    mitte = centroids[projected["plz"] == MITTE_ZIP].iloc[0]
+    lonlat = centroids.to_crs(epsg=4326)
+
+    return pd.DataFrame(
+        {
+            "zip": projected["plz"].astype(str),
+            "centroid_lon": lonlat.x,
+            "centroid_lat": lonlat.y,
+            "centroid_x": centroids.x,
+            "centroid_y": centroids.y,
+            "dist_to_mitte": projected.distance(mitte) / 1000,
+            "centroid_dist_to_mitte": centroids.distance(mitte) / 1000,
+        }
+    ).reset_index(drop=True)
+
+
+def load_zip_geometry(
+    geojson_path: str = GEOJSON_PATH, table_path: str = TABLE_PATH, rebuild: bool = False
+) -> pd.DataFrame:
+    """Returns the zip geometry table, rebuilding it if plz.geojson changed since it was cached."""
+    return cached_parquet(
+        table_path, file_digest(geojson_path), lambda: build_zip_geometry(geojson_path), rebuild
+    )
+
+
+def lookup(zip_codes, column: str = "dist_to_mitte", table: pd.DataFrame = None) -> np.ndarray:
+    """Vectorized zip code -> `column` lookup (NaN for zip codes outside plz.geojson)."""
+    table = load_zip_geometry() if table is None else table
+    values = np.append(table[column].to_numpy(dtype="float64"), np.nan)
+    zip_codes = pd.Series(zip_codes)
+    if isinstance(zip_codes.dtype, pd.CategoricalDtype):
+        # e.g. schema-encoded listings: look up the categories once, then gather by code
+        positions = pd.Index(table["zip"]).get_indexer(zip_codes.cat.categories.astype(str))
+        return values[np.append(positions, -1)[zip_codes.cat.codes.to_numpy()]]
+    positions = pd.Index(table["zip"]).get_indexer(zip_codes.to_numpy().astype(str))
+    # -1 (unknown zip) picks the trailing NaN
+    return values[positions]
@@ -0,0 +1,177 @@
+"""
+Batch point-in-polygon assignment of listing coordinates (lon / lat, EPSG:4326) to the zip areas
+of plz.geojson.
+
+    python zip_locator.py --points 1000000       # throughput on random points around Berlin
+
+The zip areas are loaded once and indexed with an STR-tree. A raster over their bounding box
+classifies every cell as outside all areas, inside exactly one area, or on a boundary; the raster
+is cached next to the other intermediaries (keyed by the digest of plz.geojson). Points in
+decided cells get their zip code from a single gather; only the points in boundary cells go
+through a vectorized STR-tree query and exact `intersects` tests. Points on a shared border get the
+area with the lower zip code.
+"""
+
+import argparse
+import functools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_store import ROOT_DIR, file_digest
+from schema import encode
+from zip_geometry import GEOJSON_PATH
+
+GRID_PATH = ROOT_DIR + "data/intermediaries/zip_grid_{}.npz"
+GRID_SIZE = 512
+
+# raster cell states besides a zip index
+OUTSIDE = -1
+BOUNDARY = -2
+
+
+class ZipLocator:
+    def __init__(self, geojson_path: str = GEOJSON_PATH, grid_size: int = GRID_SIZE):
+        import geopandas as gpd
+        import shapely
+
+        geodf = gpd.read_file(geojson_path).dissolve(by="plz", as_index=False)
+        self.zip_codes = geodf["plz"].astype(str).to_numpy()
+        self.geometries = np.asarray(geodf.geometry.array)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.bounds = geodf.total_bounds
+        self.grid_size = grid_size
+
+        grid_path = GRID_PATH.format(f"{file_digest(geojson_path)[:16]}_{grid_size}")
+        if os.path.exists(grid_path):
+            with np.load(grid_path) as npz:
+                self.grid = npz["grid"]
+        else:
+            self.grid = self._build_grid()
+            os.makedirs(os.path.dirname(grid_path), exist_ok=True)
+            tmp_path = f"{grid_path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, grid=self.grid)
+            os.replace(tmp_path, grid_path)
+
+    def _build_grid(self) -> np.ndarray:
+        """(grid_size, grid_size) int16 raster of zip indices, OUTSIDE or BOUNDARY (rows = lat)."""
+        import shapely
+
+        x0, y0, x1, y1 = self.bounds
+        xs = np.linspace(x0, x1, self.grid_size + 1)
+        ys = np.linspace(y0, y1, self.grid_size + 1)
+        left, bottom = np.meshgrid(xs[:-1], ys[:-1])
+        right, top = np.meshgrid(xs[1:], ys[1:])
+        cells = shapely.box(left.ravel(), bottom.ravel(), right.ravel(), top.ravel())
+
+        hits = np.bincount(self.tree.query(cells, predicate="intersects")[0], minlength=len(cells))
+        cell, area = self.tree.query(cells, predicate="within")
+        grid = np.where(hits == 0, OUTSIDE, BOUNDARY).astype("int16")
+        # a cell within one area that intersects no other one is decided
+        inside = hits[cell] == 1
+        grid[cell[inside]] = area[inside]
+        return grid.reshape(self.grid_size, self.grid_size)
+
+    def _cells(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """Raster state of every point (OUTSIDE beyond the bounding box and for NaN coordinates)."""
+        x0, y0, x1, y1 = self.bounds
+        with np.errstate(invalid="ignore"):
+            col = np.floor((lon - x0) / (x1 - x0) * self.grid_size)
+            row = np.floor((lat - y0) / (y1 - y0) * self.grid_size)
+            valid = (col >= 0) & (col < self.grid_size) & (row >= 0) & (row < self.grid_size)
+        states = np.full(len(lon), OUTSIDE, dtype="int16")
+        states[valid] = self.grid[row[valid].astype(np.intp), col[valid].astype(np.intp)]
+        return states
+
+    def locate(self, lon, lat) -> np.ndarray:
+        """Index into `self.zip_codes` of the area containing every point, -1 outside all areas."""
+        import shapely
+
+        lon = np.asarray(lon, dtype="float64")
+        lat = np.asarray(lat, dtype="float64")
+        index = self._cells(lon, lat).astype(np.intp)
+
+        candidates = np.flatnonzero(index == BOUNDARY)
+        index[candidates] = OUTSIDE
+        if len(candidates):
+            x, y = lon[candidates], lat[candidates]
+            # bounding-box query, then exact tests against the prepared areas (much faster than a
+            # tree query with a predicate)
+            point, area = self.tree.query(shapely.points(x, y))
+            hit = shapely.intersects_xy(self.geometries[area], x[point], y[point])
+            point, area = point[hit], area[hit]
+            # areas are in zip order: on shared borders keep the first area of every point
+            order = np.lexsort((area, point))
+            point, area = point[order], area[order]
+            first = np.r_[True, point[1:] != point[:-1]]
+            index[candidates[point[first]]] = area[first]
+        return index
+
+    def zip_codes_of(self, lon, lat) -> np.ndarray:
+        """Zip code string of every point, None outside plz.geojson."""
+        return np.append(self.zip_codes.astype(object), None)[self.locate(lon, lat)]
+
+
+@functools.lru_cache(maxsize=None)
+def load_locator(geojson_path: str = GEOJSON_PATH, grid_size: int = GRID_SIZE) -> ZipLocator:
+    """Process-wide locator, built once per plz.geojson and grid size."""
+    return ZipLocator(geojson_path, grid_size)
+
+
+def assign_zip_codes(lon, lat, locator: ZipLocator = None) -> pd.Categorical:
+    """Zip codes of lon / lat arrays, encoded with the `schema` dictionary (missing outside Berlin)."""
+    locator = load_locator() if locator is None else locator
+    return encode(locator.zip_codes_of(lon, lat), "zip_code")
+
+
+def repair_zip_codes(
+    df: pd.DataFrame, lon: str = "lon", lat: str = "lat", locator: ZipLocator = None
+) -> pd.DataFrame:
+    """
+    Replaces the `zip_code` of every listing whose coordinates fall into a zip area with that area's
+    zip code (missing or wrong scraped values); listings without usable coordinates keep theirs.
+    """
+    located = assign_zip_codes(df[lon].to_numpy(), df[lat].to_numpy(), locator)
+    current = encode(df["zip_code"], "zip_code")
+    codes = np.where(located.codes >= 0, located.codes, current.codes)
+    return df.assign(zip_code=pd.Categorical.from_codes(codes, dtype=current.dtype))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the zip code point lookup")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument("--check", type=int, default=20_000, help="points checked per-polygon")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    locator = ZipLocator(grid_size=args.grid_size)
+    print(f"locator: {time.perf_counter() - start:.2f}s")
+
+    rng = np.random.default_rng(0)
+    x0, y0, x1, y1 = locator.bounds
+    lon, lat = rng.uniform(x0, x1, args.points), rng.uniform(y0, y1, args.points)
+    start = time.perf_counter()
+    index = locator.locate(lon, lat)
+    elapsed = time.perf_counter() - start
+    boundary = (locator._cells(lon, lat) == BOUNDARY).mean()
+    print(
+        f"{args.points} points: {elapsed:.3f}s ({args.points / elapsed:,.0f} points/sec), "
+        f"{boundary:.1%} in boundary cells, {(index >= 0).mean():.1%} inside Berlin"
+    )
+
+    import shapely
+
+    n = min(args.check, args.points)
+    points = shapely.points(lon[:n], lat[:n])
+    expected = np.full(n, -1)
+    for i, geometry in reversed(list(enumerate(locator.geometries))):
+        expected[shapely.intersects(geometry, points)] = i
+    print(f"mismatches vs. per-polygon checks on {n} points: {(expected != index[:n]).sum()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Smoke run of the benchmark cases on small synthetic listings, including more zip codes than the 193
+Berlin ones of the schema dictionary.
+"""
+
+import pytest
+
+import benchmarks
+from schema import berlin_zip_codes
+
+N_ZIP_CODES = 400
+
+
+@pytest.fixture(scope="module")
+def listings(tmp_path_factory):
+    path = tmp_path_factory.mktemp("benchmarks") / "listings.parquet"
+    return benchmarks.write_synthetic(str(path), 3000, N_ZIP_CODES)
+
+
+def test_fit_frame_has_groups_beyond_the_berlin_zip_codes(listings):
+    df = benchmarks._fit_frame(listings, N_ZIP_CODES)
+    assert df["zip_code"].notna().all()
+    assert df["zip_code"].nunique() > len(berlin_zip_codes())
+
+
+@pytest.mark.parametrize("name", ["model_frame", "mixedlm", "reml", "predict"])
+def test_case_with_more_zip_codes_than_berlin(name, listings):
+    result = benchmarks.run_case(name, listings, 3000, N_ZIP_CODES, repeat=1)
+    assert result["benchmark"] == name
+    assert result["zip_codes"] == N_ZIP_CODES
+    assert result["min_seconds"] > 0
+
+
+def test_mixedlm_fits_one_intercept_per_synthetic_zip_code(listings):
+    df = benchmarks._fit_frame(listings, N_ZIP_CODES)
+    result = benchmarks.run_mixedlm(df)
+    assert len(result.random_effects) == df["zip_code"].nunique()
@@ -0,0 +1,59 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from model_store import ROOT_DIR
+
+CLI = ROOT_DIR + "scripts/cli.py"
+# none of these may be imported before a subcommand runs
+HEAVY = ["numpy", "pandas", "pyarrow", "scipy", "statsmodels", "patsy", "matplotlib", "geopandas"]
+
+
+def run_cli(*args, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, **kwargs)
+
+
+def best_of(n: int, *args) -> float:
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        run_cli(*args, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def test_help_imports_no_heavy_modules():
+    result = run_cli("-X", "importtime", CLI, "--help", check=True)
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines()}
+    assert not {module for module in imported if module.split(".")[0] in HEAVY}
+
+
+def test_help_cold_start():
+    # interpreter start-up plus argparse; a heavy import at module level takes longer than this
+    bare = best_of(3, "-c", "pass")
+    assert best_of(3, CLI, "--help") < bare + 0.3
+
+
+@pytest.mark.parametrize(
+    "listing, message",
+    [
+        ({"object_type": "APARTMENT", "square_meters": 65}, "private_offer, rooms, zip_code"),
+        ({"object_type": "APARTMENT", "private_offer": False, "rooms": "3"}, "square_meters"),
+    ],
+)
+def test_predict_input_reports_missing_fields(listing, message):
+    complete = {
+        "object_type": "APARTMENT",
+        "private_offer": False,
+        "rooms": "3",
+        "square_meters": 65,
+        "zip_code": "13059",
+    }
+    lines = "\n".join(json.dumps(item) for item in (complete, listing))
+    result = run_cli(CLI, "predict", "rentals", "--input", "-", input=lines)
+    assert result.returncode == 1
+    assert result.stderr.strip().startswith(f"listing 2: missing fields: {message}")
+    assert "Traceback" not in result.stderr
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_store import ROOT_DIR
+from quantile_sketch import TDigest, sketch_column
+
+QUANTILES = np.array([0.001, 0.01, 0.1, 0.5, 0.9, 0.99, 0.999])
+DFRENT = ROOT_DIR + "data/dfrent.parquet"
+
+
+def rank_error(values: np.ndarray, estimates: np.ndarray, q: np.ndarray) -> np.ndarray:
+    return np.abs(np.searchsorted(np.sort(values), estimates) / len(values) - q)
+
+
+def rank_bound(q: np.ndarray, delta: float, n: int) -> np.ndarray:
+    # size of a cluster around q (see the module docstring), plus one value of rounding
+    return 2 * np.pi * np.sqrt(q * (1 - q)) / delta + 1 / n
+
+
+@pytest.fixture
+def values():
+    return np.random.default_rng(0).lognormal(4, 0.6, 200_000)
+
+
+def test_exact_while_every_centroid_is_one_value():
+    values = np.random.default_rng(1).normal(size=300)
+    digest = TDigest().update(values)
+    np.testing.assert_allclose(digest.quantile(QUANTILES), np.quantile(values, QUANTILES))
+
+
+@pytest.mark.parametrize("delta, rtol", [(200, 0.05), (1000, 0.005)])
+def test_accuracy_against_np_quantile(values, delta, rtol):
+    digest = TDigest(delta).update(values)
+    estimates = digest.quantile(QUANTILES)
+    assert len(digest.weights) <= delta / 2 + 1
+    assert (
+        rank_error(values, estimates, QUANTILES) <= rank_bound(QUANTILES, delta, len(values))
+    ).all()
+    np.testing.assert_allclose(estimates, np.quantile(values, QUANTILES), rtol=rtol)
+
+
+def test_merged_chunks_match_single_pass_accuracy(values):
+    merged = TDigest()
+    for chunk in np.array_split(values, 37):
+        merged.merge(TDigest().update(chunk))
+    assert merged.count == len(values)
+    assert merged.min == values.min() and merged.max == values.max()
+    estimates = merged.quantile(QUANTILES)
+    assert (
+        rank_error(values, estimates, QUANTILES) <= rank_bound(QUANTILES, 1000, len(values))
+    ).all()
+
+
+def test_nans_are_ignored():
+    digest = TDigest().update([1.0, np.nan, 3.0, np.nan])
+    assert digest.count == 2
+    assert digest.quantile(0.5) == np.quantile([1.0, 3.0], 0.5)
+
+
+def test_empty_digest():
+    digest = TDigest().update([]).update([np.nan])
+    assert digest.count == 0
+    assert np.isnan(digest.quantile(0.5))
+    assert np.isnan(digest.quantile(QUANTILES)).all()
+    assert digest.quantile(QUANTILES).shape == QUANTILES.shape
+    # merging an empty digest changes nothing
+    other = TDigest().update([1.0, 2.0]).merge(digest)
+    assert other.count == 2 and other.min == 1.0 and other.max == 2.0
+
+
+def test_single_value():
+    digest = TDigest().update([42.5])
+    assert digest.count == 1
+    np.testing.assert_array_equal(digest.quantile(QUANTILES), np.full(len(QUANTILES), 42.5))
+    assert digest.quantile(0.0) == digest.quantile(1.0) == 42.5
+
+
+def test_round_trip_through_dict(values):
+    digest = TDigest().update(values)
+    restored = TDigest.from_dict(digest.to_dict())
+    np.testing.assert_array_equal(restored.quantile(QUANTILES), digest.quantile(QUANTILES))
+
+
+def test_square_meters_cutoff_of_the_listings():
+    values = pd.read_parquet(DFRENT, columns=["square_meters"])["square_meters"].dropna().to_numpy()
+    estimate = sketch_column(DFRENT, "square_meters").quantile(0.999)
+    assert (
+        rank_error(values, np.array([estimate]), np.array([0.999]))[0]
+        <= rank_bound(np.array([0.999]), 1000, len(values))[0]
+    )
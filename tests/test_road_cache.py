@@ -0,0 +1,112 @@
+"""
+Round trip of the per-fclass road store on a stand-in shapefile (tests/fixtures/roads/roads.shp:
+twelve lines around Berlin in EPSG:4326, six road classes) instead of the full OSM layer.
+"""
+
+import os
+import shutil
+
+import geopandas as gpd
+import pytest
+
+import road_cache
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures/roads/roads.shp")
+
+
+@pytest.fixture(autouse=True)
+def clear_memo():
+    road_cache.load_roads.cache_clear()
+    yield
+    road_cache.load_roads.cache_clear()
+
+
+@pytest.fixture
+def shapefile(tmp_path):
+    """Copy of the fixture, so tests may touch it."""
+    for name in os.listdir(os.path.dirname(FIXTURE)):
+        shutil.copy(os.path.join(os.path.dirname(FIXTURE), name), tmp_path)
+    return str(tmp_path / "roads.shp")
+
+
+def _sorted_wkt(gdf) -> list:
+    return sorted(zip(gdf["fclass"], gdf.geometry.to_wkt()))
+
+
+def test_build_writes_one_file_per_fclass(tmp_path):
+    store = tmp_path / "store"
+    manifest = road_cache.build_road_store(FIXTURE, str(store))
+    roads = gpd.read_file(FIXTURE)
+
+    assert manifest["crs"] == "EPSG:4326"
+    assert manifest["fclasses"].keys() == set(roads["fclass"])
+    for fclass, info in manifest["fclasses"].items():
+        part = roads.loc[roads["fclass"] == fclass]
+        assert info["rows"] == len(part)
+        assert info["bbox"] == pytest.approx(list(part.total_bounds))
+        assert (store / f"{fclass}.parquet").exists()
+
+
+def test_round_trip_of_all_classes(tmp_path):
+    roads = gpd.read_file(FIXTURE)
+    store = str(tmp_path / "store")
+    loaded = road_cache.load_roads(tuple(sorted(set(roads["fclass"]))), None, FIXTURE, store)
+
+    assert loaded.crs == roads.crs
+    assert list(loaded.columns) == ["fclass", "geometry"]
+    assert _sorted_wkt(loaded) == _sorted_wkt(roads)
+
+
+def test_map_classes_and_bbox(tmp_path):
+    roads = gpd.read_file(FIXTURE)
+    store = str(tmp_path / "store")
+    # the west of the stand-in: Spandau and the motorway towards Tegel
+    bbox = (13.15, 52.50, 13.35, 52.60)
+    loaded = road_cache.load_roads(road_cache.MAP_FCLASSES, bbox, FIXTURE, store)
+
+    expected = roads.loc[roads["fclass"].isin(road_cache.MAP_FCLASSES)].cx[
+        bbox[0] : bbox[2], bbox[1] : bbox[3]
+    ]
+    assert _sorted_wkt(loaded) == _sorted_wkt(expected)
+    assert "residential" not in set(loaded["fclass"])
+
+
+def test_bbox_outside_all_classes_is_empty(tmp_path):
+    loaded = road_cache.load_roads(
+        road_cache.MAP_FCLASSES, (0.0, 0.0, 1.0, 1.0), FIXTURE, str(tmp_path / "store")
+    )
+    assert len(loaded) == 0
+    assert loaded.crs == "EPSG:4326"
+
+
+def test_load_is_memoized(tmp_path):
+    store = str(tmp_path / "store")
+    first = road_cache.load_roads(road_cache.MAP_FCLASSES, None, FIXTURE, store)
+    assert road_cache.load_roads(road_cache.MAP_FCLASSES, None, FIXTURE, store) is first
+
+
+def test_store_is_rebuilt_when_the_shapefile_changes(shapefile, tmp_path):
+    store = str(tmp_path / "store")
+    road_cache.ensure_road_store(shapefile, store)
+
+    roads = gpd.read_file(shapefile)
+    roads.loc[roads["fclass"] == "footway", "fclass"] = "primary"
+    roads.to_file(shapefile)
+    manifest = road_cache.ensure_road_store(shapefile, store)
+
+    assert "footway" not in manifest["fclasses"]
+    assert manifest["fclasses"]["primary"]["rows"] == (roads["fclass"] == "primary").sum()
+    assert sorted(os.listdir(store)) == sorted(
+        [road_cache.MANIFEST] + [f"{fclass}.parquet" for fclass in manifest["fclasses"]]
+    )
+
+
+def test_store_is_used_without_the_shapefile(shapefile, tmp_path):
+    store = str(tmp_path / "store")
+    built = road_cache.ensure_road_store(shapefile, store)
+    for name in os.listdir(os.path.dirname(shapefile)):
+        if name.startswith("roads."):
+            os.remove(os.path.join(os.path.dirname(shapefile), name))
+
+    assert road_cache.ensure_road_store(shapefile, store) == built
+    assert len(road_cache.load_roads(("primary",), None, shapefile, store)) == 3